@@ -5,15 +5,30 @@ eventlet.monkey_patch()
 
 import os
 import random
-from flask import Flask, render_template, request, Blueprint, current_app
+from flask import Flask, render_template, request, Blueprint, current_app, jsonify
 from flask_socketio import SocketIO, emit as emit_ctx
+import socketio
 import time
 import traceback
 import uuid
 import logging
-import math
+import base64
+import json
+import signal
+import zlib
+from collections import OrderedDict, Counter, deque
 import psycopg2 # For PostgreSQL
+import psycopg2.extensions
+from psycopg2.extras import execute_values
+from eventlet.hubs import trampoline
+from eventlet.semaphore import Semaphore
+from eventlet.event import Event
+import atexit
 from urllib.parse import urlparse # For parsing DATABASE_URL
+try:
+    import redis # Optional: only the cross-worker shard bus needs it
+except ImportError:
+    redis = None
 
 # --- Game Settings ---
 GRID_WIDTH = 27
@@ -21,7 +36,9 @@ GRID_HEIGHT = 17
 GAME_HEARTBEAT_RATE = 0.75
 SHOUT_MANA_COST = 5
 MAX_VIEW_DISTANCE = 8
+FOV_CACHE_SIZE = int(os.environ.get('FOV_CACHE_SIZE', 1024)) # Max memoized FOV results; 0 disables the cache
 _game_loop_started_in_this_process = False
+worker_forked_at = time.monotonic() # Replaced with the fork time passed in by gunicorn's post_fork
 DESTROY_WALL_MANA_COST = 10
 CHOP_TREE_MANA_COST = 15
 INITIAL_POTIONS_DB = 3
@@ -30,6 +47,8 @@ INITIAL_WALL_ITEMS_DB = 3
 TILE_FLOOR = 0
 TILE_WALL = 1
 TILE_WATER = 2
+TILE_ENCODINGS = ('list', 'bitset') # 'list' is [{'x', 'y'}, ...]; 'bitset' is base64 of one bit per tile, row-major, LSB first
+TILE_BITSET_BYTES = (GRID_WIDTH * GRID_HEIGHT + 7) // 8
 
 SERVER_IS_RAINING = True
 DEFAULT_RAIN_INTENSITY = 0.25
@@ -40,6 +59,7 @@ PIXIE_PROXIMITY_FOR_BOOST = 3
 
 ELF_CHAR = 'E'
 TREE_CHAR = '\u2663'
+NPC_STEPS = tuple((dx, dy) for dy in (-1, 0, 1) for dx in (-1, 0, 1)) # Random NPC step, (0, 0) meaning stay put
 
 BASE_MANA_REGEN_PER_HEARTBEAT_CYCLE = 0.5
 HEARTBEATS_PER_MANA_REGEN_CYCLE = 3
@@ -49,6 +69,36 @@ SENSE_SOUND_RANGE_MAX = 8
 SENSE_SMELL_RANGE_MAX = 6
 SENSE_MAGIC_RANGE_MAX = 5
 
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5)) # Max open connections per worker
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 5.0)) # Seconds to wait for a free connection
+DB_POOL_HEALTHCHECK_AFTER = float(os.environ.get('DB_POOL_HEALTHCHECK_AFTER', 30.0)) # Idle seconds before a connection is pinged on checkout
+DB_COOPERATIVE = os.environ.get('DB_COOPERATIVE', '1') != '0' # Yield to the eventlet hub while psycopg2 waits on the socket
+PERSIST_FLUSH_INTERVAL = float(os.environ.get('PERSIST_FLUSH_INTERVAL', 5.0)) # Seconds between write-behind flushes
+PERSIST_BATCH_SIZE = int(os.environ.get('PERSIST_BATCH_SIZE', 500)) # Rows per execute_values page
+TREE_FETCH_BATCH = int(os.environ.get('TREE_FETCH_BATCH', 2000)) # Rows per round trip when streaming the trees table at startup
+LAZY_SCENE_TREES = os.environ.get('LAZY_SCENE_TREES', '0') == '1' # Read a scene's trees when the scene is first created instead of all at startup
+TICK_STATS_WINDOW = int(os.environ.get('TICK_STATS_WINDOW', 400)) # Ticks kept for the rolling phase percentiles
+TICK_PROFILER = os.environ.get('TICK_PROFILER', '0') == '1' # Sample the game loop with SIGPROF and log hot functions on overrun
+TICK_PROFILER_INTERVAL = float(os.environ.get('TICK_PROFILER_INTERVAL', 0.005)) # CPU seconds between samples
+TICK_PROFILER_TOP = int(os.environ.get('TICK_PROFILER_TOP', 15)) # Functions listed per overrun report
+SCENE_HIBERNATE_AFTER = int(os.environ.get('SCENE_HIBERNATE_AFTER', 40)) # Ticks without a player in or next to a scene before it hibernates; 0 disables
+SCENE_HIBERNATE_DROP_TERRAIN = os.environ.get('SCENE_HIBERNATE_DROP_TERRAIN', '0') == '1' # Compress a hibernating scene's tile grids
+SCENE_CATCHUP_STEPS = int(os.environ.get('SCENE_CATCHUP_STEPS', 20)) # Most NPC AI steps replayed when a scene wakes
+SCENE_SHARDS = int(os.environ.get('SCENE_SHARDS', 1)) # Worker processes the world's scenes are partitioned across
+SCENE_SHARD_INDEX = int(os.environ.get('SCENE_SHARD_INDEX', 0)) # This worker's shard; gunicorn_config assigns one per worker
+SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE') # e.g. redis://host:6379/0 so any worker can emit to any client
+SHARD_BUS_URL = os.environ.get('SHARD_BUS_URL', SOCKETIO_MESSAGE_QUEUE) # Where shards exchange player hand-offs and forwarded actions
+SHARD_BUS_CHANNEL = os.environ.get('SHARD_BUS_CHANNEL', 'wotw-shard')
+TICK_BUNDLES = os.environ.get('TICK_BUNDLES', '1') != '0' # Send each client one tick_bundle per heartbeat instead of one packet per event
+TICK_OVERRUN_POLICY = os.environ.get('TICK_OVERRUN_POLICY', 'skip') # 'skip' drops ticks missed by an overrun; 'catchup' runs them back to back
+TICK_MAX_CATCHUP = int(os.environ.get('TICK_MAX_CATCHUP', 3)) # With 'catchup', most missed ticks replayed before skipping the rest
+SENSORY_PERIOD = max(1, int(os.environ.get('SENSORY_PERIOD', 5))) # Ticks between sensory passes for a player; each tick handles 1/SENSORY_PERIOD of players
+FAST_ACTIONS = os.environ.get('FAST_ACTIONS', '0') == '1' # Apply uncontested moves and looks on arrival instead of on the next tick
+ACTION_QUEUE_LENGTH = int(os.environ.get('ACTION_QUEUE_LENGTH', 3)) # Actions a player can have waiting; the oldest is dropped when full
+ACTIONS_PER_TICK = int(os.environ.get('ACTIONS_PER_TICK', 1)) # Queued actions processed per player per heartbeat
+ACTION_RATE = float(os.environ.get('ACTION_RATE', 4.0)) # Sustained actions per second accepted from one client
+ACTION_BURST = float(os.environ.get('ACTION_BURST', 6.0)) # Token bucket size: actions a client can send back to back
+
 # --- App Setup ---
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.environ.get('FLASK_SECRET_KEY', 'a_deep_and_binding_secret_for_dev')
@@ -68,24 +118,138 @@ if not app.logger.handlers:
 app.logger.setLevel(log_level)
 # Initial log message moved to after game_manager is confirmed or within app context
 
-sio = SocketIO(logger = False, engineio_logger = False, async_mode = "eventlet")
+sio = SocketIO(logger = False, engineio_logger = False, async_mode = "eventlet", message_queue = SOCKETIO_MESSAGE_QUEUE)
 game_manager_instance = None # Global placeholder
 
 def get_player_name(sid): # Wizard names attached to accounts in the future.
     return f"Wizard-{sid[:4]}"
 
+def eventlet_wait_callback(conn, timeout = None):
+    # psycopg2 wait callback: park this greenlet on the connection's socket instead of blocking the worker.
+    while True:
+        state = conn.poll()
+        if state == psycopg2.extensions.POLL_OK:
+            break
+        elif state == psycopg2.extensions.POLL_READ:
+            trampoline(conn.fileno(), read = True)
+        elif state == psycopg2.extensions.POLL_WRITE:
+            trampoline(conn.fileno(), write = True)
+        else:
+            raise psycopg2.OperationalError(f"Bad result from poll: {state}")
+
+if DB_COOPERATIVE:
+    psycopg2.extensions.set_wait_callback(eventlet_wait_callback)
+
+class ConnectionPool:
+    # Bounded pool of psycopg2 connections shared by the greenlets of one worker.
+    def __init__(self, dsn, max_size = DB_POOL_SIZE, checkout_timeout = DB_POOL_TIMEOUT, healthcheck_after = DB_POOL_HEALTHCHECK_AFTER):
+        self.dsn = dsn
+        self.max_size = max_size
+        self.checkout_timeout = checkout_timeout
+        self.healthcheck_after = healthcheck_after
+        self.slots = Semaphore(max_size)
+        self.idle = [] # (conn, time returned), most recently used last
+        self.open_count = 0
+        self.in_use = 0
+        self.checkouts = 0
+        self.checkout_timeouts = 0
+        self.connects = 0
+        self.discarded = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+    def checkout(self):
+        start = time.time()
+        if not self.slots.acquire(timeout = self.checkout_timeout):
+            self.checkout_timeouts += 1
+            raise TimeoutError(f"No database connection free after {self.checkout_timeout}s ({self.in_use}/{self.max_size} in use).")
+        waited = time.time() - start
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+        try:
+            conn = self._take_idle() or self._connect()
+        except Exception:
+            self.slots.release()
+            raise
+        self.in_use += 1
+        self.checkouts += 1
+        return conn
+    def _take_idle(self):
+        while self.idle:
+            conn, returned_at = self.idle.pop()
+            if not conn.closed and (time.time() - returned_at < self.healthcheck_after or self._is_healthy(conn)):
+                return conn
+            self._discard(conn)
+        return None
+    def _is_healthy(self, conn):
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+    def _connect(self):
+        conn = psycopg2.connect(self.dsn)
+        self.open_count += 1
+        self.connects += 1
+        return conn
+    def _discard(self, conn):
+        self.open_count -= 1
+        self.discarded += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+    def checkin(self, conn):
+        self.in_use -= 1
+        try:
+            if conn.closed:
+                self._discard(conn)
+                return
+            if conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+            self.idle.append((conn, time.time()))
+        except Exception:
+            self._discard(conn)
+        finally:
+            self.slots.release()
+    def get_stats(self):
+        return {
+            'max_size': self.max_size,
+            'open': self.open_count,
+            'in_use': self.in_use,
+            'idle': len(self.idle),
+            'checkouts': self.checkouts,
+            'checkout_timeouts': self.checkout_timeouts,
+            'connects': self.connects,
+            'discarded': self.discarded,
+            'avg_wait': round(self.total_wait / self.checkouts, 6) if self.checkouts else 0.0,
+            'max_wait': round(self.max_wait, 6),
+            'cooperative': DB_COOPERATIVE
+        }
+
+db_pool = ConnectionPool(DATABASE_URL) if DATABASE_URL else None
+_db_tables_initialized = False
+
 def get_db_connection():
-    if not DATABASE_URL:
+    # Checks a connection out of the pool; hand it back with release_db_connection().
+    if not db_pool:
         app.logger.error("DATABASE_URL environment variable not set.")
         return None
     try:
-        conn = psycopg2.connect(DATABASE_URL)
-        return conn
+        return db_pool.checkout()
     except Exception as e:
         app.logger.error(f"Error connecting to database: {e}", exc_info = True)
         return None
 
+def release_db_connection(conn):
+    if conn and db_pool:
+        db_pool.checkin(conn)
+
 def init_db_tables():
+    global _db_tables_initialized
+    if _db_tables_initialized:
+        return
     conn = get_db_connection()
     if not conn:
         app.logger.error("Cannot initialize DB tables: No database connection.")
@@ -112,18 +276,234 @@ def init_db_tables():
                     elf_guardian_ids TEXT DEFAULT ''
                 );
             """)
+            cur.execute("CREATE INDEX IF NOT EXISTS trees_scene_idx ON trees (scene_x, scene_y)") # LAZY_SCENE_TREES reads one scene at a time
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS scenes (
+                    scene_x INTEGER, scene_y INTEGER,
+                    terrain BYTEA NOT NULL, version INTEGER NOT NULL DEFAULT 0,
+                    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (scene_x, scene_y)
+                );
+            """)
             conn.commit()
+        _db_tables_initialized = True
         app.logger.info("Database tables checked/created successfully.")
     except Exception as e:
         app.logger.error(f"Error initializing database tables: {e}", exc_info = True)
     finally:
-        if conn: conn.close()
+        release_db_connection(conn)
+
+PLAYER_UPSERT_SQL = """
+    INSERT INTO players (player_id, name, scene_x, scene_y, x, y, char, current_health, max_health, current_mana, max_mana, potions, walls, gold, is_wet, last_seen)
+    VALUES %s
+    ON CONFLICT (player_id) DO UPDATE SET
+        name=EXCLUDED.name, scene_x=EXCLUDED.scene_x, scene_y=EXCLUDED.scene_y,
+        x=EXCLUDED.x, y=EXCLUDED.y, char=EXCLUDED.char, current_health=EXCLUDED.current_health,
+        max_health=EXCLUDED.max_health, current_mana=EXCLUDED.current_mana, max_mana=EXCLUDED.max_mana,
+        potions=EXCLUDED.potions, walls=EXCLUDED.walls, gold=EXCLUDED.gold, is_wet=EXCLUDED.is_wet,
+        last_seen=CURRENT_TIMESTAMP;
+"""
+PLAYER_UPSERT_TEMPLATE = "(%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,CURRENT_TIMESTAMP)"
+TREE_UPSERT_SQL = """
+    INSERT INTO trees (tree_id, scene_x, scene_y, x, y, species, is_ancient, is_chopped_down, name, lore_name, elf_guardian_ids)
+    VALUES %s
+    ON CONFLICT (tree_id) DO UPDATE SET
+        is_chopped_down = EXCLUDED.is_chopped_down, elf_guardian_ids = EXCLUDED.elf_guardian_ids;
+"""
+SCENE_UPSERT_SQL = """
+    INSERT INTO scenes (scene_x, scene_y, terrain, version, updated_at)
+    VALUES %s
+    ON CONFLICT (scene_x, scene_y) DO UPDATE SET
+        terrain = EXCLUDED.terrain, version = EXCLUDED.version, updated_at = CURRENT_TIMESTAMP
+    WHERE scenes.version < EXCLUDED.version;
+"""
+SCENE_UPSERT_TEMPLATE = "(%s,%s,%s,%s,CURRENT_TIMESTAMP)"
+
+class WriteBehindQueue:
+    # Players, trees and scene terrain are marked dirty from the game loop and written in batches by a background greenlet.
+    # Marking the same entity twice before a flush coalesces into one row holding its latest state.
+    def __init__(self, flush_interval = PERSIST_FLUSH_INTERVAL, batch_size = PERSIST_BATCH_SIZE):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.dirty_players = {}
+        self.dirty_trees = {}
+        self.dirty_scenes = {}
+        self.greenlet = None
+        self.running = False
+        self.max_depth = 0
+        self.flushes = 0
+        self.flush_failures = 0
+        self.rows_written = 0
+        self.last_flush_rows = 0
+        self.last_flush_duration = 0.0
+    def depth(self):
+        return len(self.dirty_players) + len(self.dirty_trees) + len(self.dirty_scenes)
+    def queue_player(self, player):
+        self.dirty_players[player.id] = player
+        self.max_depth = max(self.max_depth, self.depth())
+    def queue_tree(self, tree):
+        self.dirty_trees[tree.id] = tree
+        self.max_depth = max(self.max_depth, self.depth())
+    def queue_scene(self, scene):
+        self.dirty_scenes[(scene.scene_x, scene.scene_y)] = scene
+        self.max_depth = max(self.max_depth, self.depth())
+    def flush(self):
+        if not self.dirty_players and not self.dirty_trees and not self.dirty_scenes:
+            return 0
+        players, self.dirty_players = self.dirty_players, {}
+        trees, self.dirty_trees = self.dirty_trees, {}
+        scenes, self.dirty_scenes = self.dirty_scenes, {}
+        if not DATABASE_URL:
+            return 0
+        start = time.time()
+        conn = get_db_connection()
+        if not conn:
+            self._requeue(players, trees, scenes)
+            self.flush_failures += 1
+            return 0
+        try:
+            with conn.cursor() as cur:
+                if players:
+                    execute_values(cur, PLAYER_UPSERT_SQL, [p.get_db_row() for p in players.values()], template = PLAYER_UPSERT_TEMPLATE, page_size = self.batch_size)
+                if trees:
+                    execute_values(cur, TREE_UPSERT_SQL, [t.get_db_row() for t in trees.values()], page_size = self.batch_size)
+                if scenes:
+                    execute_values(cur, SCENE_UPSERT_SQL, [s.get_db_row() for s in scenes.values()], template = SCENE_UPSERT_TEMPLATE, page_size = self.batch_size)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            self._requeue(players, trees, scenes)
+            self.flush_failures += 1
+            app.logger.error(f"Write-behind flush of {len(players)} players / {len(trees)} trees / {len(scenes)} scenes failed: {e}", exc_info = True)
+            return 0
+        finally:
+            release_db_connection(conn)
+        self.flushes += 1
+        self.last_flush_rows = len(players) + len(trees) + len(scenes)
+        self.rows_written += self.last_flush_rows
+        self.last_flush_duration = time.time() - start
+        app.logger.debug(f"Write-behind flushed {len(players)} players / {len(trees)} trees / {len(scenes)} scenes in {self.last_flush_duration:.4f}s.")
+        return self.last_flush_rows
+    def _requeue(self, players, trees, scenes):
+        # Anything marked dirty again while the flush ran is newer; keep it.
+        for pid, player in players.items():
+            self.dirty_players.setdefault(pid, player)
+        for tid, tree in trees.items():
+            self.dirty_trees.setdefault(tid, tree)
+        for sc, scene in scenes.items():
+            self.dirty_scenes.setdefault(sc, scene)
+    def _run(self):
+        while self.running:
+            eventlet.sleep(self.flush_interval)
+            try:
+                with app.app_context():
+                    self.flush()
+            except Exception as e:
+                app.logger.error(f"Write-behind loop error: {e}", exc_info = True)
+    def start(self):
+        if not self.running:
+            self.running = True
+            self.greenlet = eventlet.spawn(self._run)
+    def stop(self):
+        self.running = False
+        with app.app_context():
+            self.flush()
+    def get_stats(self):
+        return {
+            'depth': self.depth(),
+            'dirty_players': len(self.dirty_players),
+            'dirty_trees': len(self.dirty_trees),
+            'dirty_scenes': len(self.dirty_scenes),
+            'max_depth': self.max_depth,
+            'flushes': self.flushes,
+            'flush_failures': self.flush_failures,
+            'rows_written': self.rows_written,
+            'last_flush_rows': self.last_flush_rows,
+            'last_flush_duration': round(self.last_flush_duration, 4)
+        }
+
+write_behind_queue = WriteBehindQueue()
+atexit.register(write_behind_queue.stop)
+
+def scene_room(sx, sy):
+    # Socket.IO room holding every client whose player is in scene (sx, sy).
+    return f"scene:{sx}:{sy}"
+
+def scene_shard(sx, sy, shard_count):
+    # crc32 rather than hash() so every worker agrees regardless of PYTHONHASHSEED.
+    if shard_count <= 1:
+        return 0
+    return zlib.crc32(f"{sx},{sy}".encode()) % shard_count
+
+def configure_scene_shard(index, count):
+    global SCENE_SHARD_INDEX, SCENE_SHARDS
+    if count > 1 and not SOCKETIO_MESSAGE_QUEUE:
+        # Falling back to one world per worker would run several full copies of the world against the same tables.
+        raise RuntimeError(f"SCENE_SHARDS={count} needs SOCKETIO_MESSAGE_QUEUE so emits reach clients on other workers.")
+    if count > 1 and SHARD_BUS_URL != 'local://':
+        # Without a working bus a player crossing into another shard's scene is dropped by one shard and never added by the other.
+        if not (SHARD_BUS_URL and SHARD_BUS_URL.startswith(('redis://', 'rediss://'))):
+            raise RuntimeError(f"SCENE_SHARDS={count} needs a redis:// SHARD_BUS_URL (or SOCKETIO_MESSAGE_QUEUE) for the shard bus, got {SHARD_BUS_URL!r}.")
+        if not redis:
+            raise RuntimeError("SHARD_BUS_URL points at Redis but the redis package is not installed.")
+    SCENE_SHARD_INDEX, SCENE_SHARDS = index, count
+
+class LocalShardBus:
+    # In-process stand-in for the shard bus (SHARD_BUS_URL=local://): delivers between GameManagers that live in the same process.
+    shards = {}
+    def __init__(self, shard_index, handler):
+        self.shard_index = shard_index
+        LocalShardBus.shards[shard_index] = handler
+    def publish(self, shard, message):
+        handler = LocalShardBus.shards.get(shard)
+        if not handler:
+            app.logger.warning(f"Shard bus: no local shard {shard} for {message.get('type')}.")
+            return
+        eventlet.spawn_n(handler, json.loads(json.dumps(message)))
+    def broadcast(self, message):
+        for handler in list(LocalShardBus.shards.values()):
+            eventlet.spawn_n(handler, json.loads(json.dumps(message)))
+    def close(self):
+        LocalShardBus.shards.pop(self.shard_index, None)
+
+class RedisShardBus:
+    # Redis pub/sub between worker processes: one channel per shard plus one every shard listens on.
+    def __init__(self, url, shard_index, handler, channel = SHARD_BUS_CHANNEL):
+        self.channel = channel
+        self.handler = handler
+        self.client = redis.Redis.from_url(url)
+        self.pubsub = self.client.pubsub(ignore_subscribe_messages = True)
+        self.pubsub.subscribe(f"{channel}:{shard_index}", f"{channel}:all")
+        self.listener = eventlet.spawn(self._listen)
+    def _listen(self):
+        for item in self.pubsub.listen():
+            try:
+                self.handler(json.loads(item['data']))
+            except Exception as e:
+                app.logger.error(f"Shard bus: error handling message: {e}", exc_info = True)
+    def publish(self, shard, message):
+        self.client.publish(f"{self.channel}:{shard}", json.dumps(message))
+    def broadcast(self, message):
+        self.client.publish(f"{self.channel}:all", json.dumps(message))
+    def close(self):
+        self.listener.kill()
+        self.pubsub.close()
+
+def make_shard_bus(shard_index, handler):
+    # configure_scene_shard has already refused anything but local://, or redis:// with the redis package installed.
+    if SHARD_BUS_URL == 'local://':
+        app.logger.warning(f"Shard {shard_index}: using the in-process shard bus; hand-offs only reach shards in this process.")
+        return LocalShardBus(shard_index, handler)
+    return RedisShardBus(SHARD_BUS_URL, shard_index, handler)
+
+configure_scene_shard(SCENE_SHARD_INDEX, SCENE_SHARDS)
 
 class Tree:
+    __slots__ = ('id', 'scene_x', 'scene_y', 'x', 'y', 'species', 'is_ancient', 'is_chopped_down', 'name', 'lore_name', 'elf_guardian_ids')
+    type = "Tree"
+    char = TREE_CHAR
     def __init__(self, scene_x, scene_y, x, y, tree_id=None, species="Oak", is_ancient=True, is_chopped_down=False, name=None, elf_guardian_ids_str=""):
         self.id = tree_id if tree_id else str(uuid.uuid4())
-        self.type = "Tree"
-        self.char = TREE_CHAR
         self.scene_x = scene_x
         self.scene_y = scene_y
         self.x = x
@@ -150,42 +530,32 @@ class Tree:
             'lore_name': self.lore_name,
             'elf_guardian_ids': self.elf_guardian_ids
         }
+    def get_db_row(self):
+        return (self.id, self.scene_x, self.scene_y, self.x, self.y, self.species, self.is_ancient, self.is_chopped_down, self.name, self.lore_name, ",".join(self.elf_guardian_ids))
     def save_to_db(self):
-        conn = get_db_connection()
-        if not conn:
-            return
-        try:
-            with conn.cursor() as cur:
-                elf_ids_str = ",".join(self.elf_guardian_ids)
-                cur.execute("""
-                    INSERT INTO trees (tree_id, scene_x, scene_y, x, y, species, is_ancient, is_chopped_down, name, lore_name, elf_guardian_ids)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    ON CONFLICT (tree_id) DO UPDATE SET
-                        is_chopped_down = EXCLUDED.is_chopped_down, elf_guardian_ids = EXCLUDED.elf_guardian_ids;
-                """, (self.id, self.scene_x, self.scene_y, self.x, self.y, self.species, self.is_ancient, self.is_chopped_down, self.name, self.lore_name, elf_ids_str))
-                conn.commit()
-        except Exception as e:
-            app.logger.error(f"Error saving tree {self.id} to DB: {e}", exc_info = True)
-        finally:
-            if conn:
-                conn.close()
+        write_behind_queue.queue_tree(self)
 
 class ManaPixie:
+    __slots__ = ('id', 'scene_x', 'scene_y', 'x', 'y', 'is_hidden', 'is_hidden_by_tree')
+    type = "ManaPixie"
+    char = PIXIE_CHAR
+    sensory_cues = { # (cue key, chance, range) per sense, shared by every pixie
+        'sight': (('SENSORY.PIXIE_SIGHT_SHIMMER', 0.8, SENSE_SIGHT_RANGE), ('SENSORY.PIXIE_SIGHT_DART', 0.6, SENSE_SIGHT_RANGE)),
+        'sound': (('SENSORY.PIXIE_SOUND_CHIME', 0.7, 5),('SENSORY.PIXIE_SOUND_WINGS', 0.4, 3)),
+        'smell': (('SENSORY.PIXIE_SMELL_OZONE', 0.3, 2),),
+        'magic': (('SENSORY.PIXIE_MAGIC_AURA', 0.9, 4),)}
+    wander_chance = 0.3 # Per-tick chance of trying a random step; see GameManager.step_scene_npcs
     def __init__(self, scene_x, scene_y, initial_x = None, initial_y = None):
         self.id = str(uuid.uuid4())
-        self.type = "ManaPixie"
-        self.char = PIXIE_CHAR
         self.scene_x = scene_x
         self.scene_y = scene_y
         self.x = initial_x if initial_x is not None else random.randint(0, GRID_WIDTH - 1)
         self.y = initial_y if initial_y is not None else random.randint(0, GRID_HEIGHT - 1)
-        self.name = f"Pixie-{self.id[:4]}"
-        self.sensory_cues = {
-            'sight': [('SENSORY.PIXIE_SIGHT_SHIMMER', 0.8, SENSE_SIGHT_RANGE), ('SENSORY.PIXIE_SIGHT_DART', 0.6, SENSE_SIGHT_RANGE)],
-            'sound': [('SENSORY.PIXIE_SOUND_CHIME', 0.7, 5),('SENSORY.PIXIE_SOUND_WINGS', 0.4, 3)],
-            'smell': [('SENSORY.PIXIE_SMELL_OZONE', 0.3, 2)],
-            'magic': [('SENSORY.PIXIE_MAGIC_AURA', 0.9, 4)]}
         self.is_hidden = False
+        self.is_hidden_by_tree = False
+    @property
+    def name(self):
+        return f"Pixie-{self.id[:4]}"
     def get_public_data(self):
         return {
             'id': self.id,
@@ -197,14 +567,6 @@ class ManaPixie:
             'scene_y': self.scene_y,
             'type': self.type
         }
-    def wander(self, scene):
-        if random.random() < 0.3:
-            dx, dy = random.choice([-1, 0, 1]), random.choice([-1, 0, 1])
-            if dx == 0 and dy == 0:
-                return
-            new_x, new_y = self.x + dx, self.y + dy
-            if scene.is_walkable(new_x, new_y) and not scene.is_entity_at(new_x, new_y, exclude_id = self.id):
-                self.x, self.y = new_x, new_y
     def attempt_evade(self, player_x, player_y, scene):
         possible_moves = []
         for dx_evade in [-1, 0, 1]:
@@ -216,28 +578,37 @@ class ManaPixie:
                     possible_moves.append((evade_x, evade_y))
         if possible_moves:
             self.x, self.y = random.choice(possible_moves)
+            scene.update_npc_position(self)
             return True
         return False
 
 class Elf:
+    __slots__ = ('id', 'scene_x', 'scene_y', 'x', 'y', 'home_tree_id', 'state', 'max_health', 'current_health', 'is_sneaking', 'is_hidden', 'is_hidden_by_tree')
+    type = "Elf"
+    race = "Wood"
+    char = ELF_CHAR
+    lore_name = f"{race} Elf"
+    sensory_cues = {'sight': (('SENSORY.ELF_SIGHT_GRACEFUL', 0.7, SENSE_SIGHT_RANGE),), 'sound': (('SENSORY.ELF_SOUND_RUSTLE', 0.5, 4), ('SENSORY.ELF_SOUND_SOFT_SONG', 0.2, 6)), 'smell': (('SENSORY.ELF_SMELL_PINE', 0.4, 3),), 'magic': (('SENSORY.ELF_MAGIC_NATURE', 0.6, 3),)}
+    wander_radius = 4 # Elves near their tree drift back once further than this, and never step beyond wander_radius + 1
+    wander_chance = 0.2 # Per-tick chance of a step while the home tree stands
+    stray_chance = 0.15 # Step chance on the tick the home tree is found gone
+    distressed_chance = 0.05 * 0.15 # Step chance once distressed_no_tree
     def __init__(self, scene_x, scene_y, initial_x = None, initial_y = None, home_tree_id = None):
         self.id = str(uuid.uuid4())
-        self.type = "Elf"
-        self.race = "Wood"
-        self.char = ELF_CHAR
         self.scene_x = scene_x
         self.scene_y = scene_y
         self.x = initial_x if initial_x is not None else random.randint(0, GRID_WIDTH - 1)
         self.y = initial_y if initial_y is not None else random.randint(0, GRID_HEIGHT - 1)
-        self.name = f"Elf-{self.id[:4]}"
-        self.lore_name = f"{self.race} Elf"
         self.home_tree_id = home_tree_id
         self.state = "wandering_near_tree"
         self.max_health = 30
         self.current_health = self.max_health
         self.is_sneaking = False
-        self.sensory_cues = {'sight': [('SENSORY.ELF_SIGHT_GRACEFUL', 0.7, SENSE_SIGHT_RANGE)], 'sound': [('SENSORY.ELF_SOUND_RUSTLE', 0.5, 4), ('SENSORY.ELF_SOUND_SOFT_SONG', 0.2, 6)], 'smell': [('SENSORY.ELF_SMELL_PINE', 0.4, 3)], 'magic': [('SENSORY.ELF_MAGIC_NATURE', 0.6, 3)]}
+        self.is_hidden = False
         self.is_hidden_by_tree = False
+    @property
+    def name(self):
+        return f"Elf-{self.id[:4]}"
     def get_public_data(self):
         return {
             'id': self.id,
@@ -252,46 +623,10 @@ class Elf:
             'state': self.state,
             'is_hidden_by_tree': self.is_hidden_by_tree
         }
-    def update_ai(self, scene, game_manager):
-        home_tree = game_manager.get_tree(self.home_tree_id) if self.home_tree_id else None
-        if self.state == "distressed_no_tree":
-            if random.random() < 0.05:
-                self.wander_randomly(scene)
-            return
-        if self.state == "wandering_near_tree":
-            if home_tree and not home_tree.is_chopped_down:
-                self.wander_near_tree(scene, home_tree)
-            else:
-                self.state = "distressed_no_tree"
-                self.wander_randomly(scene)
-        self.is_hidden_by_tree = bool(home_tree and not home_tree.is_chopped_down and self.x == home_tree.x and self.y == home_tree.y)
-    def wander_near_tree(self, scene, tree):
-        WANDER_RADIUS = 4
-        if random.random() < 0.2:
-            dist = math.sqrt((self.x - tree.x) ** 2 + (self.y - tree.y) ** 2)
-            dx, dy = (0, 0)
-            if dist > WANDER_RADIUS:
-                dx = 1 if self.x < tree.x else -1 if self.x > tree.x else 0
-                dy = 1 if self.y < tree.y else -1 if self.y > tree.y else 0
-            else:
-                dx, dy = random.choice([-1, 0, 1]),random.choice([-1, 0, 1])
-            if dx == 0 and dy == 0:
-                return
-            nx, ny = self.x + dx, self.y + dy
-            if math.sqrt((nx - tree.x) ** 2 + (ny - tree.y) ** 2) > WANDER_RADIUS + 1:
-                return
-            if scene.is_walkable(nx, ny) and not scene.is_entity_at(nx, ny, exclude_id = self.id):
-                self.x, self.y = nx, ny
-    def wander_randomly(self, scene):
-        if random.random() < 0.15:
-            dx, dy = random.choice([-1, 0, 1]),random.choice([-1, 0, 1])
-            if dx == 0 and dy == 0:
-                return
-            nx, ny = self.x + dx, self.y + dy
-            if scene.is_walkable(nx, ny) and not scene.is_entity_at(nx, ny, exclude_id = self.id):
-                self.x, self.y = nx, ny
 
 class Player:
+    __slots__ = ('id', 'name', 'scene_x', 'scene_y', 'x', 'y', 'char', 'current_health', 'max_health', 'current_mana', 'max_mana',
+                 'potions', 'walls', 'gold', 'is_wet', 'time_became_wet', 'mana_regen_accumulator', 'visible_tiles_cache')
     def __init__(self, sid, name, db_data = None):
         self.id = sid
         self.name = name
@@ -326,29 +661,17 @@ class Player:
         self.time_became_wet = 0
         self.mana_regen_accumulator = 0.0
         self.visible_tiles_cache = set()
+    def get_db_row(self):
+        return (self.id,self.name,self.scene_x,self.scene_y,self.x,self.y,self.char,self.current_health,self.max_health,self.current_mana,self.max_mana,self.potions,self.walls,self.gold,self.is_wet)
+    def get_state(self):
+        return {
+            'scene_x': self.scene_x, 'scene_y': self.scene_y, 'x': self.x, 'y': self.y, 'char': self.char,
+            'current_health': self.current_health, 'max_health': self.max_health,
+            'current_mana': self.current_mana, 'max_mana': self.max_mana,
+            'potions': self.potions, 'walls': self.walls, 'gold': self.gold, 'is_wet': self.is_wet
+        }
     def save_to_db(self):
-        conn = get_db_connection()
-        if not conn:
-            return
-        try:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    INSERT INTO players (player_id, name, scene_x, scene_y, x, y, char, current_health, max_health, current_mana, max_mana, potions, walls, gold, is_wet, last_seen)
-                    VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,CURRENT_TIMESTAMP)
-                    ON CONFLICT (player_id) DO UPDATE SET
-                        name=EXCLUDED.name, scene_x=EXCLUDED.scene_x, scene_y=EXCLUDED.scene_y,
-                        x=EXCLUDED.x, y=EXCLUDED.y, char=EXCLUDED.char, current_health=EXCLUDED.current_health,
-                        max_health=EXCLUDED.max_health, current_mana=EXCLUDED.current_mana, max_mana=EXCLUDED.max_mana,
-                        potions=EXCLUDED.potions, walls=EXCLUDED.walls, gold=EXCLUDED.gold, is_wet=EXCLUDED.is_wet,
-                        last_seen=CURRENT_TIMESTAMP;
-                """, (self.id,self.name,self.scene_x,self.scene_y,self.x,self.y,self.char,self.current_health,self.max_health,self.current_mana,self.max_mana,self.potions,self.walls,self.gold,self.is_wet))
-                conn.commit()
-            app.logger.debug(f"Saved player {self.name} ({self.id}) to DB.")
-        except Exception as e:
-            app.logger.error(f"Error saving player {self.name} ({self.id}) to DB: {e}", exc_info = True)
-        finally:
-            if conn:
-                conn.close()
+        write_behind_queue.queue_player(self)
     def update_position(self, dx, dy, new_char, gm, sio_inst):
         osx, osy = self.scene_x, self.scene_y
         ox, oy = self.x, self.y
@@ -388,6 +711,7 @@ class Player:
                 sio_inst.emit('lore_message', {'messageKey': tk, 'placeholders': {'scene_x': self.scene_x, 'scene_y': self.scene_y}, 'type': 'system'}, room = self.id)
         elif self.x != ox or self.y != oy or char_changed:
             cs = gm.get_or_create_scene(self.scene_x, self.scene_y)
+            cs.update_player_position(self)
             self.visible_tiles_cache = gm.calculate_fov(self.x, self.y, cs, SENSE_SIGHT_RANGE)
         return scf or (self.x != ox or self.y != oy or char_changed)
     def drink_potion(self, sio_inst):
@@ -466,6 +790,101 @@ class Player:
             'is_wet': self.is_wet
         }
 
+def tile_table(*tile_types):
+    # bytes.translate table: 1 for the given tile types, 0 for everything else.
+    table = bytearray(256)
+    for tile_type in tile_types:
+        table[tile_type] = 1
+    return bytes(table)
+
+SOLID_TILE_TABLE = bytes(0 if tile_type in (TILE_FLOOR, TILE_WATER) else 1 for tile_type in range(256))
+WALL_TILE_TABLE = tile_table(TILE_WALL)
+WATER_TILE_TABLE = tile_table(TILE_WATER)
+
+MANHATTAN_NEIGHBOURHOODS = {} # (x, y, radius) -> (((x, y), distance), ...)
+
+def manhattan_neighbourhood(x, y, radius):
+    # Every in-bounds tile within `radius` steps of (x, y) with its distance, memoised.
+    key = (x, y, radius)
+    tiles = MANHATTAN_NEIGHBOURHOODS.get(key)
+    if tiles is None:
+        tiles = MANHATTAN_NEIGHBOURHOODS[key] = tuple(((tx, ty), abs(tx - x) + abs(ty - y))
+            for ty in range(max(0, y - radius), min(GRID_HEIGHT, y + radius + 1))
+            for tx in range(max(0, x - radius), min(GRID_WIDTH, x + radius + 1)) if abs(tx - x) + abs(ty - y) <= radius)
+    return tiles
+
+SENSORY_SENSES = ('sound', 'smell', 'magic') # Senses that reach past line of sight, in the order they are tried
+SENSORY_RINGS = {} # NPC class -> cues reachable at each distance, see sensory_rings
+
+def sensory_rings(npc_class):
+    # rings[d] is the (sense, cue key, chance) tuple of non-sight cues that reach d steps from an NPC of this class,
+    # in the order they are tried, with the distance falloff already applied to the chance.
+    rings = SENSORY_RINGS.get(npc_class)
+    if rings is None:
+        cues = [(sense, cue) for sense in SENSORY_SENSES for cue in npc_class.sensory_cues.get(sense, ())]
+        reach = max((cue_range for _, (_, _, cue_range) in cues), default = -1)
+        rings = SENSORY_RINGS[npc_class] = tuple(
+            tuple((sense, cue_key, reliability * (1 - (dist / (cue_range + 1.0))) * 0.5) for sense, (cue_key, reliability, cue_range) in cues if dist <= cue_range)
+            for dist in range(reach + 1))
+    return rings
+
+def tiles_to_payload(tiles):
+    return [{'x': x, 'y': y} for x, y in sorted(tiles, key = lambda t: (t[1], t[0]))]
+
+def tiles_to_bitset(tiles):
+    bits = 0
+    for x, y in tiles:
+        bits |= 1 << (y * GRID_WIDTH + x)
+    return base64.b64encode(bits.to_bytes(TILE_BITSET_BYTES, 'little')).decode('ascii')
+
+def view_tiles_payload(view, tile_encoding):
+    if tile_encoding == 'bitset':
+        return {'tile_bits': {'visible': tiles_to_bitset(view['tiles']), 'walls': tiles_to_bitset(view['walls']), 'water': tiles_to_bitset(view['water'])}}
+    return {
+        'visible_terrain': {'walls': tiles_to_payload(view['walls']), 'water': tiles_to_payload(view['water'])},
+        'all_visible_tiles': tiles_to_payload(view['tiles'])
+    }
+
+class OccupancyIndex:
+    # Tracks which entities of one kind stand on which tile of a scene.
+    def __init__(self):
+        self.positions = {}
+        self.tiles = {}
+    def __contains__(self, eid):
+        return eid in self.positions
+    def __len__(self):
+        return len(self.positions)
+    def ids(self):
+        return list(self.positions)
+    def entities(self):
+        return [entity for occupants in self.tiles.values() for entity in occupants.values()]
+    def place(self, entity):
+        pos = (entity.x, entity.y)
+        old_pos = self.positions.get(entity.id)
+        if old_pos == pos:
+            return
+        if old_pos is not None:
+            self._unlink(entity.id, old_pos)
+        self.positions[entity.id] = pos
+        self.tiles.setdefault(pos, {})[entity.id] = entity
+    def remove(self, eid):
+        pos = self.positions.pop(eid, None)
+        if pos is not None:
+            self._unlink(eid, pos)
+    def _unlink(self, eid, pos):
+        occupants = self.tiles.get(pos)
+        if occupants is not None:
+            occupants.pop(eid, None)
+            if not occupants:
+                del self.tiles[pos]
+    def get_at(self, x, y, exclude_id = None):
+        occupants = self.tiles.get((x, y))
+        if occupants:
+            for eid, entity in occupants.items():
+                if eid != exclude_id:
+                    return entity
+        return None
+
 class Scene:
     def __init__(self, scene_x, scene_y, name_gen = None):
         self.scene_x = scene_x
@@ -473,101 +892,321 @@ class Scene:
         self.name = f"Area ({scene_x}, {scene_y})"
         if name_gen:
             self.name = name_gen(scene_x, scene_y)
-        self.players_sids = set()
-        self.npc_ids = set()
-        self.tree_ids = set()
-        self.terrain_grid = [[TILE_FLOOR for _ in range(GRID_WIDTH)] for _ in range(GRID_HEIGHT)]
+        self.player_index = OccupancyIndex()
+        self.npc_index = OccupancyIndex()
+        self.tree_index = OccupancyIndex()
+        self.terrain = bytearray([TILE_FLOOR]) * (GRID_WIDTH * GRID_HEIGHT) # One tile type per byte, row-major; also the scenes.terrain format
+        self.tile_position_cache = {} # translate table -> frozenset of matching (x, y); cleared on terrain change
+        self.opaque_mask = bytearray(GRID_WIDTH * GRID_HEIGHT) # 1 where sight is blocked, row-major
+        self.blocked_mask = bytearray(GRID_WIDTH * GRID_HEIGHT) # 1 where movement is blocked, row-major
+        self.terrain_version = 0 # Bumped whenever opaque_mask changes; part of the FOV cache key
+        self.terrain_revision = 0 # Bumped on every tile type change; stored as scenes.version
         self.is_indoors = False
-        self.game_manager_ref = get_game_manager()
-    def add_player(self, pid):
-        self.players_sids.add(pid)
+        self.hibernating = False
+        self.idle_ticks = 0
+        self.hibernated_at = 0 # Loop iteration the scene went to sleep on
+        self.packed_terrain = None # zlib of terrain, opaque and blocked bytes while the grids are dropped
+        self.sensory_table = None # (x, y) -> non-sight cues that reach that tile; dropped whenever an NPC is added, moved or removed
+        self.lock = Semaphore() # Held while an action is applied to this scene, by the tick or the FAST_ACTIONS path
+    def add_player(self, player):
+        self.player_index.place(player)
     def remove_player(self, pid):
-        self.players_sids.discard(pid)
+        self.player_index.remove(pid)
+    def update_player_position(self, player):
+        self.player_index.place(player)
     def get_player_sids(self):
-        return list(self.players_sids)
-    def add_npc(self, nid):
-        self.npc_ids.add(nid)
+        return self.player_index.ids()
+    def add_npc(self, npc):
+        self.npc_index.place(npc)
+        self.sensory_table = None
     def remove_npc(self, nid):
-        self.npc_ids.discard(nid)
+        self.npc_index.remove(nid)
+        self.sensory_table = None
+    def update_npc_position(self, npc):
+        self.npc_index.place(npc)
+        self.sensory_table = None
+    def get_sensory_table(self):
+        # (x, y) -> [(npc, cues)] for every NPC with a sound/smell/magic cue reaching the tile, in index order;
+        # cues is that NPC's sensory_rings entry for the distance.
+        if self.sensory_table is None:
+            table = {}
+            for nid, (nx, ny) in self.npc_index.positions.items():
+                npc = self.npc_index.tiles[(nx, ny)][nid]
+                rings = sensory_rings(type(npc))
+                for pos, dist in manhattan_neighbourhood(nx, ny, len(rings) - 1):
+                    entry = table.get(pos)
+                    if entry is None:
+                        table[pos] = [(npc, rings[dist])]
+                    else:
+                        entry.append((npc, rings[dist]))
+            self.sensory_table = table
+        return self.sensory_table
     def get_npc_ids(self):
-        return list(self.npc_ids)
-    def add_tree(self, tid):
-        self.tree_ids.add(tid)
+        return self.npc_index.ids()
+    def add_tree(self, tree):
+        self.tree_index.place(tree)
+        self.refresh_tile_masks(tree.x, tree.y)
+    def add_trees(self, trees):
+        for tree in trees:
+            self.tree_index.place(tree)
+        self.rebuild_tile_masks()
     def remove_tree(self, tid):
-        self.tree_ids.discard(tid)
+        pos = self.tree_index.positions.get(tid)
+        self.tree_index.remove(tid)
+        if pos is not None:
+            self.refresh_tile_masks(*pos)
     def get_tree_ids(self):
-        return list(self.tree_ids)
+        return self.tree_index.ids()
+    def get_tree_at(self, x, y):
+        return self.tree_index.get_at(x, y)
+    def get_npc_at(self, x, y, exclude_id = None):
+        return self.npc_index.get_at(x, y, exclude_id)
+    def get_player_at(self, x, y, exclude_id = None):
+        return self.player_index.get_at(x, y, exclude_id)
+    def get_players_near(self, x, y, radius):
+        # Players within Chebyshev distance `radius` of (x, y); walks whichever is smaller, the players or the tiles.
+        side = 2 * radius + 1
+        if len(self.player_index) <= side * side:
+            return [p for p in self.player_index.entities() if abs(p.x - x) <= radius and abs(p.y - y) <= radius]
+        near = []
+        for ty in range(max(0, y - radius), min(GRID_HEIGHT, y + radius + 1)):
+            for tx in range(max(0, x - radius), min(GRID_WIDTH, x + radius + 1)):
+                occupants = self.player_index.tiles.get((tx, ty))
+                if occupants:
+                    near.extend(occupants.values())
+        return near
     def get_tile_type(self, x, y):
+        if self.packed_terrain is not None:
+            self.unpack_terrain()
         if 0 <= y < GRID_HEIGHT and 0 <= x < GRID_WIDTH:
-            return self.terrain_grid[y][x]
+            return self.terrain[y * GRID_WIDTH + x]
         return TILE_WALL
+    def tile_mask(self, table):
+        # 1 where table maps the tile type to 1 (see tile_table), laid out like the terrain itself.
+        self.unpack_terrain()
+        return self.terrain.translate(table)
+    def tile_positions(self, table):
+        # Every (x, y) whose type the table selects; rebuilt from the mask only after the terrain changes.
+        positions = self.tile_position_cache.get(table)
+        if positions is None:
+            mask = self.tile_mask(table)
+            found = []
+            i = mask.find(1)
+            while i != -1:
+                found.append((i % GRID_WIDTH, i // GRID_WIDTH))
+                i = mask.find(1, i + 1)
+            positions = self.tile_position_cache[table] = frozenset(found)
+        return positions
+    def tiles_in(self, visible_tiles, table):
+        # Masked extraction: a set intersection instead of a per-tile terrain lookup.
+        return visible_tiles & self.tile_positions(table)
     def is_transparent(self, x, y):
+        if self.packed_terrain is not None:
+            self.unpack_terrain()
         if not(0 <= x < GRID_WIDTH and 0 <= y < GRID_HEIGHT):
             return False
-        gm = get_game_manager()
-        if gm and gm.get_tree_at(x, y, self.scene_x, self.scene_y):
-            tree = gm.get_tree_at(x, y, self.scene_x, self.scene_y)
-            if tree and not tree.is_chopped_down:
-                return False
-        tile_type = self.terrain_grid[y][x]
-        return tile_type == TILE_FLOOR or tile_type == TILE_WATER
+        return not self.opaque_mask[y * GRID_WIDTH + x]
     def is_walkable(self, x, y):
+        if self.packed_terrain is not None:
+            self.unpack_terrain()
         if not(0 <= x < GRID_WIDTH and 0 <= y < GRID_HEIGHT):
             return False
-        tile_type = self.get_tile_type(x, y)
-        gm = get_game_manager()
-        if gm:
-            tree = gm.get_tree_at(x, y, self.scene_x, self.scene_y)
-            if tree and not tree.is_chopped_down:
-                return False
-        return tile_type == TILE_FLOOR or tile_type == TILE_WATER
+        return not self.blocked_mask[y * GRID_WIDTH + x]
+    def refresh_tile_masks(self, x, y):
+        # Call after anything that changes what stands on (x, y): terrain edits, tree spawn or chop.
+        self.unpack_terrain()
+        i = y * GRID_WIDTH + x
+        tree = self.tree_index.get_at(x, y)
+        solid = SOLID_TILE_TABLE[self.terrain[i]] or bool(tree and not tree.is_chopped_down)
+        if self.opaque_mask[i] != solid:
+            self.terrain_version += 1
+        self.opaque_mask[i] = solid
+        self.blocked_mask[i] = solid
+    def rebuild_tile_masks(self):
+        # Whole-scene version of refresh_tile_masks, for bulk terrain changes.
+        self.unpack_terrain()
+        solid = bytearray(self.tile_mask(SOLID_TILE_TABLE))
+        for tree in self.tree_index.entities():
+            if not tree.is_chopped_down:
+                solid[tree.y * GRID_WIDTH + tree.x] = 1
+        if solid != self.opaque_mask:
+            self.terrain_version += 1
+        self.opaque_mask = solid
+        self.blocked_mask = bytearray(solid)
+    def _terrain_changed(self):
+        self.tile_position_cache.clear()
+        self.terrain_revision += 1
+        write_behind_queue.queue_scene(self)
     def set_tile_type(self,x,y,tt):
+        self.unpack_terrain()
         if 0 <= y < GRID_HEIGHT and 0 <= x < GRID_WIDTH:
-            self.terrain_grid[y][x] = tt
+            i = y * GRID_WIDTH + x
+            if self.terrain[i] != tt:
+                self.terrain[i] = tt
+                self._terrain_changed()
+            self.refresh_tile_masks(x, y)
             return True
         return False
-    def get_terrain_for_payload(self,visible_tiles):
-        td = {'walls': [], 'water': []}
-        if not visible_tiles:
-            return td
-        for r, row in enumerate(self.terrain_grid):
-            for c, tt in enumerate(row):
-                if(c, r) in visible_tiles:
-                    if tt == TILE_WALL:
-                        td['walls'].append({'x': c, 'y': r})
-                    elif tt == TILE_WATER:
-                        td['water'].append({'x': c, 'y': r})
-        return td
+    def set_tiles(self, tiles, tt):
+        self.unpack_terrain()
+        changed = 0
+        for x, y in tiles:
+            if 0 <= y < GRID_HEIGHT and 0 <= x < GRID_WIDTH and self.terrain[y * GRID_WIDTH + x] != tt:
+                self.terrain[y * GRID_WIDTH + x] = tt
+                self.refresh_tile_masks(x, y)
+                changed += 1
+        if changed:
+            self._terrain_changed()
+        return changed
+    def fill_region(self, x0, y0, x1, y1, tt):
+        # Sets every tile in the inclusive rectangle, clipped to the grid.
+        self.unpack_terrain()
+        x0, x1 = max(0, min(x0, x1)), min(GRID_WIDTH - 1, max(x0, x1))
+        y0, y1 = max(0, min(y0, y1)), min(GRID_HEIGHT - 1, max(y0, y1))
+        if x0 > x1 or y0 > y1:
+            return False
+        run = bytes([tt]) * (x1 - x0 + 1)
+        changed = False
+        for y in range(y0, y1 + 1):
+            start = y * GRID_WIDTH + x0
+            if self.terrain[start:start + len(run)] != run:
+                self.terrain[start:start + len(run)] = run
+                changed = True
+        if changed:
+            self._terrain_changed()
+            self.rebuild_tile_masks()
+        return changed
+    def get_terrain_bytes(self):
+        if self.packed_terrain is not None:
+            return zlib.decompress(self.packed_terrain)[:GRID_WIDTH * GRID_HEIGHT]
+        return bytes(self.terrain)
+    def load_terrain_bytes(self, terrain, revision):
+        if len(terrain) != GRID_WIDTH * GRID_HEIGHT:
+            app.logger.error(f"Stored terrain for scene ({self.scene_x}, {self.scene_y}) has {len(terrain)} tiles, expected {GRID_WIDTH * GRID_HEIGHT}. Ignoring it.")
+            return False
+        self.unpack_terrain()
+        self.terrain[:] = terrain
+        self.tile_position_cache.clear()
+        self.rebuild_tile_masks()
+        self.terrain_revision = revision
+        return True
+    def get_db_row(self):
+        return (self.scene_x, self.scene_y, psycopg2.Binary(self.get_terrain_bytes()), self.terrain_revision)
+    def pack_terrain(self):
+        if self.packed_terrain is not None:
+            return
+        flat = self.get_terrain_bytes()
+        self.packed_terrain = zlib.compress(flat + bytes(self.opaque_mask) + bytes(self.blocked_mask))
+        self.terrain = self.opaque_mask = self.blocked_mask = None
+        self.tile_position_cache.clear()
+    def unpack_terrain(self):
+        # Restores the grids byte for byte, so terrain_version and cached FOV stay valid. Every terrain reader and
+        # writer calls this first, so touching a hibernating scene with SCENE_HIBERNATE_DROP_TERRAIN just brings its
+        # grids back (the scene stays asleep) instead of failing on the dropped ones.
+        if self.packed_terrain is None:
+            return
+        raw = zlib.decompress(self.packed_terrain)
+        size = GRID_WIDTH * GRID_HEIGHT
+        self.terrain = bytearray(raw[:size])
+        self.opaque_mask = bytearray(raw[size:2 * size])
+        self.blocked_mask = bytearray(raw[2 * size:])
+        self.packed_terrain = None
+    def get_visible_terrain_tiles(self, visible_tiles):
+        return self.tiles_in(visible_tiles, WALL_TILE_TABLE), self.tiles_in(visible_tiles, WATER_TILE_TABLE)
     def is_entity_at(self, x, y, exclude_id = None):
-        gm = get_game_manager()
         if self.is_npc_at(x,y,exclude_id):
             return True
         if self.is_player_at(x, y):
             return True
-        tree = gm.get_tree_at(x, y, self.scene_x, self.scene_y)
-        if tree and not tree.is_chopped_down and tree.id != exclude_id:
+        tree = self.tree_index.get_at(x, y, exclude_id)
+        if tree and not tree.is_chopped_down:
             return True
         return False
     def is_npc_at(self, x, y, exclude_id = None):
-        gm = get_game_manager()
-        if not gm:
-            return False
-        for nid in self.npc_ids:
-            if exclude_id and nid == exclude_id:
-                continue
-            npc = gm.get_npc(nid)
-            if npc and npc.x == x and npc.y == y:
-                return True
-        return False
+        return self.npc_index.get_at(x, y, exclude_id) is not None
     def is_player_at(self, x, y, pid_check = None):
-        gm = get_game_manager()
-        if not gm:
-            return False
-        for psid in self.players_sids:
-            player = gm.get_player(psid)
-            if player and player.x == x and player.y == y:
-                return True
+        return self.player_index.get_at(x, y) is not None
+
+class ClientSyncState:
+    # What one client was last sent, so game updates can be sent as deltas against it.
+    def __init__(self):
+        self.supports_deltas = False
+        self.tile_encoding = 'list'
+        self.last_view = None # None forces a full game_update on the next heartbeat
+
+class SceneSnapshot:
+    # Public data of everything in one scene, serialized once per tick and filtered per observer.
+    def __init__(self):
+        self.players = [] # (x, y, sid, public data)
+        self.npcs = [] # (x, y, public data); sneaking NPCs are left out
+        self.trees = [] # (x, y, public data)
+
+class ActionQueue:
+    # One client's input: a token bucket checked at ingress, the bounded queue of actions waiting for the tick,
+    # and counters of what was dropped.
+    def __init__(self):
+        self.actions = deque(maxlen = ACTION_QUEUE_LENGTH)
+        self.tokens = ACTION_BURST
+        self.refilled_at = time.monotonic()
+        self.accepted = 0
+        self.rate_limited = 0 # Refused at ingress, no feedback sent
+        self.overflowed = 0 # Queued, then pushed out unprocessed by newer actions
+        self.fast_tick = -1 # Loop iteration the FAST_ACTIONS applied in fast_used were counted against
+        self.fast_used = 0
+    def fast_used_since(self, tick):
+        # Fast actions applied after tick ran; they come out of the next tick's ACTIONS_PER_TICK.
+        return self.fast_used if self.fast_tick == tick else 0
+    def charge_fast(self, tick):
+        self.fast_used = self.fast_used_since(tick) + 1
+        self.fast_tick = tick
+    def allow(self):
+        now = time.monotonic()
+        self.tokens = min(ACTION_BURST, self.tokens + (now - self.refilled_at) * ACTION_RATE)
+        self.refilled_at = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        self.rate_limited += 1
         return False
+    def push(self, action):
+        if len(self.actions) == self.actions.maxlen:
+            self.overflowed += 1
+        self.actions.append(action)
+        self.accepted += 1
+    def get_stats(self):
+        return {'queued': len(self.actions), 'accepted': self.accepted, 'rate_limited': self.rate_limited, 'overflowed': self.overflowed}
+
+class OutboundBuffer:
+    # Stands in for the SocketIO instance as GameManager.socketio. While a tick is open, emits addressed to a single
+    # room (a client SID or a scene room) are held per room and sent at flush as one 'tick_bundle' of [event, data]
+    # pairs, in order. Outside a tick, and for emits to several rooms or with extra routing arguments (skip_sid,
+    # namespace...), it emits straight away.
+    def __init__(self, sio_inst):
+        self.sio = sio_inst
+        self.pending = {} # room -> [[event, data], ...]
+        self.open = False
+        self.bundles = 0
+        self.bundled_events = 0
+    def __getattr__(self, name):
+        return getattr(self.sio, name)
+    def begin_tick(self):
+        self.open = TICK_BUNDLES
+    def emit(self, event, data = None, room = None, **kwargs):
+        if not self.open or not isinstance(room, str) or kwargs:
+            return self.sio.emit(event, data, room = room, **kwargs)
+        self.pending.setdefault(room, []).append([event, data])
+    def flush(self):
+        self.open = False
+        pending, self.pending = self.pending, {}
+        for room, events in pending.items():
+            if len(events) == 1:
+                self.sio.emit(events[0][0], events[0][1], room = room)
+                continue
+            self.sio.emit('tick_bundle', {'events': events}, room = room)
+            self.bundles += 1
+            self.bundled_events += len(events)
+    def get_stats(self):
+        return {'bundles': self.bundles, 'bundled_events': self.bundled_events, 'pending_rooms': len(self.pending)}
 
 class GameManager:
     def __init__(self,sio_inst):
@@ -575,72 +1214,182 @@ class GameManager:
         self.scenes = {}
         self.all_npcs = {}
         self.all_trees = {}
-        self.queued_actions = {}
+        self.action_queues = {} # SID -> ActionQueue, for owned players and for every client connected here
+        self.fast_actions = 0
+        self.client_sync = {}
         self.socketio = sio_inst
         self.server_is_raining = SERVER_IS_RAINING
-        self.heartbeats_until_mana_regen = HEARTBEATS_PER_MANA_REGEN_CYCLE
         self.loop_is_actually_running_flag = False
         self.game_loop_greenlet = None
         self.loop_iteration_count = 0
+        self.fov_cache = OrderedDict()
+        self.fov_cache_size = FOV_CACHE_SIZE
+        self.fov_cache_hits = 0
+        self.fov_cache_misses = 0
+        self.shard_index = SCENE_SHARD_INDEX
+        self.shard_count = SCENE_SHARDS
+        self.local_sids = set() # Clients whose socket is connected to this worker
+        self.remote_owner = {} # SID -> shard holding that player, for players this worker does not simulate
+        self.shard_bus = None # Created last: its listener can call add_player as soon as it exists
+        self.active_scenes = {} # Scenes that are simulated every tick; the rest of self.scenes is hibernating
+        self.stored_scene_keys = set() # Scenes with a row in the scenes table, loaded on first use
+        self.scene_loads = {} # (sx, sy) -> Event sent once the greenlet building that scene has registered it
+        self.load_stored_scene_keys()
+        self.scene_hibernations = 0
+        self.scene_wakes = 0
+        self.scene_catchup_steps = 0
         self._fov_octant_transforms=[
             (1,0,0,1), (0,1,1,0), (0,-1,1,0), (-1,0,0,1),
             (-1,0,0,-1), (0,-1,-1,0), (0,1,-1,0), (1,0,0,-1)
         ]
         self.load_all_trees_from_db()
-    def load_all_trees_from_db(self):
+        if self.shard_count > 1:
+            self.shard_bus = make_shard_bus(self.shard_index, self.handle_shard_message)
+    def load_stored_scene_keys(self):
         conn = get_db_connection()
         if not conn:
             return
         try:
             with conn.cursor() as cur:
-                cur.execute("SELECT tree_id, scene_x, scene_y, x, y, species, is_ancient, is_chopped_down, name, lore_name, elf_guardian_ids FROM trees")
-                for row in cur.fetchall():
-                    tid, sx, sy, x, y, sp, ia, ic, n, ln, eids_str = row
-                    tree = Tree(sx, sy, x, y, tid, sp, ia, ic, n, eids_str)
-                    self.all_trees[tree.id] = tree
-                    scene = self.get_or_create_scene(sx, sy)
-                    if tree.id not in scene.tree_ids:
-                        scene.add_tree(tree.id)
-                app.logger.info(f"Loaded {len(self.all_trees)} trees from DB.")
+                cur.execute("SELECT scene_x, scene_y FROM scenes")
+                self.stored_scene_keys = {(sx, sy) for sx, sy in cur.fetchall()}
+            app.logger.info(f"{len(self.stored_scene_keys)} scenes have stored terrain.")
+        except Exception as e:
+            app.logger.error(f"Error listing stored scenes: {e}", exc_info = True)
+        finally:
+            release_db_connection(conn)
+    def load_scene_terrain(self, scene):
+        conn = get_db_connection()
+        if not conn:
+            return False
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT terrain, version FROM scenes WHERE scene_x=%s AND scene_y=%s", (scene.scene_x, scene.scene_y))
+                row = cur.fetchone()
+            if row:
+                return scene.load_terrain_bytes(bytes(row[0]), row[1])
+        except Exception as e:
+            app.logger.error(f"Error loading terrain for scene ({scene.scene_x}, {scene.scene_y}): {e}", exc_info = True)
+        finally:
+            release_db_connection(conn)
+        return False
+    def load_all_trees_from_db(self):
+        if LAZY_SCENE_TREES:
+            app.logger.info("LAZY_SCENE_TREES on: trees are read per scene on first use.")
+            return
+        started = time.monotonic()
+        by_scene, rows = self.fetch_trees()
+        created = 0
+        for scene_key, trees in by_scene.items():
+            created += scene_key not in self.scenes
+            self.index_scene_trees(self.get_or_create_scene(*scene_key, announce = False), trees)
+        app.logger.info(f"Loaded {len(self.all_trees)} trees of {rows} rows into {len(by_scene)} scenes ({created} created) from DB in {time.monotonic() - started:.2f}s.")
+    def fetch_trees(self, scene_key = None):
+        # Whole table through a named (server-side) cursor, TREE_FETCH_BATCH rows per round trip, so the rows never sit
+        # in memory all at once; grouped by scene for index_scene_trees. Returns ({(sx, sy): [Tree]}, rows read).
+        conn = get_db_connection()
+        if not conn:
+            return {}, 0
+        by_scene, owned, rows = {}, {}, 0
+        try:
+            with (conn.cursor(name = 'tree_bootstrap') if scene_key is None else conn.cursor()) as cur:
+                sql = "SELECT tree_id, scene_x, scene_y, x, y, species, is_ancient, is_chopped_down, name, elf_guardian_ids FROM trees"
+                if scene_key is None:
+                    cur.itersize = TREE_FETCH_BATCH
+                    cur.execute(sql)
+                else:
+                    cur.execute(sql + " WHERE scene_x=%s AND scene_y=%s", scene_key)
+                while True:
+                    batch = cur.fetchmany(TREE_FETCH_BATCH)
+                    if not batch:
+                        break
+                    rows += len(batch)
+                    for tid, sx, sy, x, y, sp, ia, ic, n, eids_str in batch:
+                        key = (sx, sy)
+                        if key not in owned:
+                            owned[key] = self.owns_scene(sx, sy)
+                        if owned[key]:
+                            by_scene.setdefault(key, []).append(Tree(sx, sy, x, y, tid, sp, ia, ic, n, eids_str))
         except Exception as e:
             app.logger.error(f"Error loading trees from DB: {e}", exc_info = True)
         finally:
-            if conn:
-                conn.close()
+            release_db_connection(conn)
+        return by_scene, rows
+    def index_scene_trees(self, scene, trees):
+        for tree in trees:
+            self.all_trees[tree.id] = tree
+        scene.add_trees([tree for tree in trees if tree.id not in scene.tree_index])
     def calculate_fov(self, ox, oy, scene, radius):
+        if self.fov_cache_size <= 0:
+            return self.compute_fov(ox, oy, scene, radius)
+        key = (scene.scene_x, scene.scene_y, scene.terrain_version, ox, oy, radius)
+        vt = self.fov_cache.get(key)
+        if vt is not None:
+            self.fov_cache.move_to_end(key)
+            self.fov_cache_hits += 1
+            return vt
+        self.fov_cache_misses += 1
+        vt = frozenset(self.compute_fov(ox, oy, scene, radius))
+        self.fov_cache[key] = vt
+        if len(self.fov_cache) > self.fov_cache_size:
+            self.fov_cache.popitem(last = False)
+        return vt
+    def get_fov_cache_stats(self):
+        lookups = self.fov_cache_hits + self.fov_cache_misses
+        return {
+            'size': len(self.fov_cache),
+            'capacity': self.fov_cache_size,
+            'hits': self.fov_cache_hits,
+            'misses': self.fov_cache_misses,
+            'hit_rate': round(self.fov_cache_hits / lookups, 4) if lookups else 0.0
+        }
+    def compute_fov(self, ox, oy, scene, radius):
         vt = set()
         vt.add((ox, oy))
+        opaque = scene.opaque_mask
         for octant in range(8):
-            self._cast_light_octant(ox, oy, radius, 1, 1.0, 0.0, octant, scene, vt)
+            self._cast_light_octant(ox, oy, radius, 1, 1.0, 0.0, octant, opaque, vt)
         return vt
-    def _cast_light_octant(self, cx, cy, radius, row_depth, start_slope, end_slope, octant, scene, visible_tiles):
+    def _cast_light_octant(self, cx, cy, radius, row_depth, start_slope, end_slope, octant, opaque, visible_tiles):
+        # Reads only the scene's opaque_mask. Each row is clipped to the grid up front (exactly one of xx / yx
+        # is non-zero), and rows never reach dy = +-0.5, so the slopes need no zero guard.
         xx, xy, yx, yy = self._fov_octant_transforms[octant]
         rsq = radius * radius
+        width, height = GRID_WIDTH, GRID_HEIGHT
+        mark_visible = visible_tiles.add
         if start_slope < end_slope:
             return
         for i in range(row_depth, radius + 1):
             blocked = False
-            dx, dy= -i, -i
-            while dx <= 0:
-                dx += 1
-                mx = cx + dx * xx + dy * xy
-                my = cy + dx * yx + dy * yy
-                if not(0 <= mx < GRID_WIDTH and 0 <= my < GRID_HEIGHT):
-                    continue
-                ls = (dx - 0.5) / (dy + 0.5) if (dy + 0.5) != 0 else float('inf') * math.copysign(1, dx - 0.5)
-                rs = (dx + 0.5) / (dy - 0.5) if (dy - 0.5) != 0 else float('inf') * math.copysign(1, dx + 0.5)
+            dy = -i
+            row_x, row_y = cx + dy * xy, cy + dy * yy
+            if xx:
+                if not 0 <= row_y < height:
+                    break
+                lo, hi = (-row_x, width - 1 - row_x) if xx > 0 else (row_x - width + 1, row_x)
+            else:
+                if not 0 <= row_x < width:
+                    break
+                lo, hi = (-row_y, height - 1 - row_y) if yx > 0 else (row_y - height + 1, row_y)
+            ls_div, rs_div = dy + 0.5, dy - 0.5
+            dy_sq = dy * dy
+            for dx in range(max(-i + 1, lo), min(1, hi) + 1):
+                rs = (dx + 0.5) / rs_div
                 if start_slope < rs:
                     continue
-                elif end_slope > ls:
+                ls = (dx - 0.5) / ls_div
+                if end_slope > ls:
                     break
-                if (dx * dx + dy * dy) < rsq:
-                    visible_tiles.add((mx, my))
-                if not scene.is_transparent(mx, my):
+                mx = row_x + dx * xx
+                my = row_y + dx * yx
+                if (dx * dx + dy_sq) < rsq:
+                    mark_visible((mx, my))
+                if opaque[my * width + mx]:
                     if blocked:
                         continue
                     else:
                         blocked = True
-                        self._cast_light_octant(cx, cy, radius, i + 1, start_slope, ls, octant, scene, visible_tiles)
+                        self._cast_light_octant(cx, cy, radius, i + 1, start_slope, ls, octant, opaque, visible_tiles)
                         start_slope = rs
                 else:
                     if blocked:
@@ -648,7 +1397,14 @@ class GameManager:
                         start_slope = rs
             if blocked:
                 break
+    def refresh_fov_after_terrain_change(self, scene, x, y):
+        # The shadowcaster only reads tiles inside the square of side 2r+1 around its origin, so nobody
+        # farther away (Chebyshev distance) can see a different picture after (x, y) changes.
+        for p in scene.get_players_near(x, y, SENSE_SIGHT_RANGE):
+            p.visible_tiles_cache = self.calculate_fov(p.x, p.y, scene, SENSE_SIGHT_RANGE)
     def spawn_initial_npcs_and_entities(self):
+        if not self.owns_scene(0, 0):
+            return
         scene_0_0 = self.get_or_create_scene(0, 0)
         for i in range(2):
             px, py = random.randint(0, GRID_WIDTH - 1), random.randint(0, GRID_HEIGHT - 1)
@@ -656,16 +1412,16 @@ class GameManager:
                 px, py = random.randint(0, GRID_WIDTH - 1), random.randint(0, GRID_HEIGHT - 1)
             pixie = ManaPixie(0, 0, initial_x = px, initial_y = py)
             self.all_npcs[pixie.id] = pixie
-            scene_0_0.add_npc(pixie.id)
+            scene_0_0.add_npc(pixie)
             app.logger.info(f"Spawned transient {pixie.type} {pixie.name} at S(0, 0) T({pixie.x}, {pixie.y})")
-        if not any(t for t in self.all_trees.values() if t.scene_x == 0 and t.scene_y == 0):
+        if not scene_0_0.get_tree_ids():
             tx, ty = 5, 5
             while not scene_0_0.is_walkable(tx, ty) or scene_0_0.is_entity_at(tx, ty):
                 tx, ty = random.randint(2, GRID_WIDTH - 3), random.randint(2, GRID_HEIGHT - 3)
             test_tree = Tree(0, 0, tx, ty)
             test_tree.save_to_db()
             self.all_trees[test_tree.id] = test_tree
-            scene_0_0.add_tree(test_tree.id)
+            scene_0_0.add_tree(test_tree)
             app.logger.info(f"Spawned and saved {test_tree.type} {test_tree.name} at S(0, 0) T({test_tree.x}, {test_tree.y})")
             for i in range(2):
                 ex, ey = test_tree.x, test_tree.y
@@ -683,7 +1439,7 @@ class GameManager:
                             ex, ey = tx + 1, ty
                 elf = Elf(0, 0, initial_x = ex, initial_y = ey, home_tree_id = test_tree.id)
                 self.all_npcs[elf.id] = elf
-                scene_0_0.add_npc(elf.id)
+                scene_0_0.add_npc(elf)
                 test_tree.elf_guardian_ids.append(elf.id)
             test_tree.save_to_db()
             app.logger.info(f"Spawned transient Elves for {test_tree.name}")
@@ -692,41 +1448,157 @@ class GameManager:
     def get_tree(self, tid):
         return self.all_trees.get(tid)
     def get_tree_at(self, x, y, sx, sy):
-        for tobj in self.all_trees.values():
-            if tobj.scene_x == sx and tobj.scene_y == sy and tobj.x == x and tobj.y == y:
-                return tobj
-        return None
-    def get_visible_trees_for_observer(self, obs_p):
-        vtd = []
-        scene = self.get_or_create_scene(obs_p.scene_x, obs_p.scene_y)
-        for tid in scene.get_tree_ids():
-            tree = self.get_tree(tid)
-            if tree and (tree.x, tree.y) in obs_p.visible_tiles_cache:
-                vtd.append(tree.get_public_data())
-        return vtd
+        scene = self.scenes.get((sx, sy))
+        return scene.get_tree_at(x, y) if scene else None
+    def get_visible_trees_for_observer(self, obs_p, snapshot = None):
+        snapshot = snapshot or self.build_scene_snapshot(self.get_or_create_scene(obs_p.scene_x, obs_p.scene_y))
+        tiles = obs_p.visible_tiles_cache
+        return [data for x, y, data in snapshot.trees if (x, y) in tiles]
     def setup_spawn_shrine(self, scene_obj):
         mid_x, mid_y = GRID_WIDTH // 2, GRID_HEIGHT // 2
         shrine_size = 2
-        for i in range(-shrine_size, shrine_size + 1):
-            scene_obj.set_tile_type(mid_x + i, mid_y - shrine_size, TILE_WALL)
-            scene_obj.set_tile_type(mid_x + i, mid_y + shrine_size, TILE_WALL)
-            if abs(i) < shrine_size:
-                scene_obj.set_tile_type(mid_x - shrine_size, mid_y + i, TILE_WALL)
-                scene_obj.set_tile_type(mid_x + shrine_size, mid_y + i, TILE_WALL)
-        scene_obj.set_tile_type(mid_x, mid_y + shrine_size, TILE_FLOOR)
-        scene_obj.set_tile_type(mid_x - (shrine_size + 2), mid_y, TILE_WATER)
-        scene_obj.set_tile_type(mid_x - (shrine_size + 2), mid_y + 1, TILE_WATER)
-        scene_obj.set_tile_type(mid_x + (shrine_size + 2), mid_y - 1, TILE_WATER)
-    def get_or_create_scene(self, sx, sy):
+        scene_obj.fill_region(mid_x - shrine_size, mid_y - shrine_size, mid_x + shrine_size, mid_y + shrine_size, TILE_FLOOR)
+        ring = [(mid_x + i, mid_y + j) for i in range(-shrine_size, shrine_size + 1) for j in range(-shrine_size, shrine_size + 1) if max(abs(i), abs(j)) == shrine_size]
+        scene_obj.set_tiles([pos for pos in ring if pos != (mid_x, mid_y + shrine_size)], TILE_WALL) # Gap in the south wall is the way in
+        scene_obj.set_tiles([(mid_x - (shrine_size + 2), mid_y), (mid_x - (shrine_size + 2), mid_y + 1), (mid_x + (shrine_size + 2), mid_y - 1)], TILE_WATER)
+    def get_or_create_scene(self, sx, sy, announce = True):
         sc = (sx, sy)
+        pending = self.scene_loads.get(sc)
+        if pending is not None:
+            pending.wait() # The DB reads below yield to the hub; don't build a second Scene for the same key meanwhile
         if sc not in self.scenes:
-            ns = Scene(sx, sy)
-            if sx == 0 and sy == 0:
-                self.setup_spawn_shrine(ns)
-            self.scenes[sc] = ns
-            app.logger.info(f"Created new scene at ({sx}, {sy}): {ns.name}")
-        return self.scenes[sc]
-    def add_player(self,sid):
+            self.scene_loads[sc] = pending = Event()
+            try:
+                ns = Scene(sx, sy)
+                loaded = sc in self.stored_scene_keys and self.load_scene_terrain(ns)
+                if sx == 0 and sy == 0 and not loaded:
+                    self.setup_spawn_shrine(ns)
+                if LAZY_SCENE_TREES:
+                    self.index_scene_trees(ns, self.fetch_trees(sc)[0].get(sc, []))
+                self.scenes[sc] = ns
+                self.active_scenes[sc] = ns
+            finally:
+                del self.scene_loads[sc]
+                pending.send()
+            if announce:
+                app.logger.info(f"{'Loaded' if loaded else 'Created new'} scene at ({sx}, {sy}): {ns.name}")
+        scene = self.scenes[sc]
+        if scene.hibernating:
+            self.wake_scene(scene)
+        return scene
+    def prefetch_scenes_around(self, sx, sy):
+        # Reads the owned neighbours of (sx, sy) that need the DB in background greenlets, so a player walking
+        # over the edge finds the scene built instead of process_actions waiting on the DB mid-tick.
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                sc = (sx + dx, sy + dy)
+                if sc in self.scenes or sc in self.scene_loads or not self.owns_scene(*sc):
+                    continue
+                if LAZY_SCENE_TREES or sc in self.stored_scene_keys:
+                    eventlet.spawn_n(self.get_or_create_scene, *sc)
+    def step_scene_npcs(self, scene):
+        # One AI step for every NPC in the scene, batched: roll every move decision up front, then resolve the
+        # candidate steps in order against a per-tile occupancy count and re-index the NPCs that moved.
+        npcs = [npc for npc in map(self.all_npcs.get, scene.get_npc_ids()) if npc is not None]
+        if not npcs:
+            return
+        homes = [None] * len(npcs) # Standing home tree for elves wandering near it
+        chances = [ManaPixie.wander_chance] * len(npcs)
+        for i, npc in enumerate(npcs):
+            if not isinstance(npc, Elf):
+                continue
+            tree = self.all_trees.get(npc.home_tree_id) if npc.home_tree_id else None
+            if npc.state == "distressed_no_tree":
+                chances[i] = Elf.distressed_chance
+            elif tree is not None and not tree.is_chopped_down:
+                homes[i], chances[i] = tree, Elf.wander_chance
+            else:
+                npc.state, chances[i] = "distressed_no_tree", Elf.stray_chance
+                npc.is_hidden_by_tree = False
+        movers = [i for i, roll in enumerate([random.random() for _ in npcs]) if roll < chances[i]]
+        directions = random.choices(NPC_STEPS, k = len(movers))
+        occupied = list(scene.blocked_mask) # Non-zero where a step is not allowed: blocking tiles, then +1 per player and NPC
+        for positions in (scene.player_index.positions, scene.npc_index.positions):
+            for x, y in positions.values():
+                occupied[y * GRID_WIDTH + x] += 1
+        radius_sq, leash_sq = Elf.wander_radius ** 2, (Elf.wander_radius + 1) ** 2
+        moved = []
+        for i, (dx, dy) in zip(movers, directions):
+            npc, tree = npcs[i], homes[i]
+            x, y = npc.x, npc.y
+            if tree is not None:
+                if (x - tree.x) ** 2 + (y - tree.y) ** 2 > radius_sq:
+                    dx = (x < tree.x) - (x > tree.x)
+                    dy = (y < tree.y) - (y > tree.y)
+                if (x + dx - tree.x) ** 2 + (y + dy - tree.y) ** 2 > leash_sq:
+                    continue
+            if dx == 0 and dy == 0:
+                continue
+            nx, ny = x + dx, y + dy
+            if not (0 <= nx < GRID_WIDTH and 0 <= ny < GRID_HEIGHT):
+                continue
+            target = ny * GRID_WIDTH + nx
+            if occupied[target]:
+                continue
+            occupied[y * GRID_WIDTH + x] -= 1
+            occupied[target] += 1
+            npc.x, npc.y = nx, ny
+            moved.append(npc)
+        for npc in moved:
+            scene.update_npc_position(npc)
+        for npc, tree in zip(npcs, homes):
+            if tree is not None:
+                npc.is_hidden_by_tree = npc.x == tree.x and npc.y == tree.y
+    def update_scene_hibernation(self):
+        # Scenes with no player in them or in a neighbouring scene stop ticking after SCENE_HIBERNATE_AFTER heartbeats.
+        if SCENE_HIBERNATE_AFTER <= 0:
+            return
+        watched = set()
+        for p_obj in self.players.values():
+            for dx in (-1, 0, 1):
+                for dy in (-1, 0, 1):
+                    watched.add((p_obj.scene_x + dx, p_obj.scene_y + dy))
+        for sc, scene in list(self.active_scenes.items()):
+            if sc in watched:
+                scene.idle_ticks = 0
+                continue
+            scene.idle_ticks += 1
+            if scene.idle_ticks >= SCENE_HIBERNATE_AFTER:
+                self.hibernate_scene(scene)
+    def hibernate_scene(self, scene):
+        scene.hibernating = True
+        scene.hibernated_at = self.loop_iteration_count
+        self.active_scenes.pop((scene.scene_x, scene.scene_y), None)
+        if SCENE_HIBERNATE_DROP_TERRAIN:
+            scene.pack_terrain()
+        self.scene_hibernations += 1
+        app.logger.info(f"Scene ({scene.scene_x}, {scene.scene_y}) hibernating after {scene.idle_ticks} idle ticks. Active scenes: {len(self.active_scenes)}")
+    def wake_scene(self, scene):
+        if scene.packed_terrain is not None:
+            scene.unpack_terrain()
+        scene.hibernating = False
+        scene.idle_ticks = 0
+        self.active_scenes[(scene.scene_x, scene.scene_y)] = scene
+        # Coarse catch-up: replay a bounded number of NPC steps so the scene doesn't look frozen in time.
+        steps = min(self.loop_iteration_count - scene.hibernated_at, SCENE_CATCHUP_STEPS)
+        for _ in range(steps):
+            self.step_scene_npcs(scene)
+        self.scene_wakes += 1
+        self.scene_catchup_steps += steps
+        app.logger.info(f"Scene ({scene.scene_x}, {scene.scene_y}) woke after {self.loop_iteration_count - scene.hibernated_at} ticks ({steps} catch-up steps).")
+    def get_scene_stats(self):
+        return {
+            'scenes': len(self.scenes),
+            'active': len(self.active_scenes),
+            'hibernating': len(self.scenes) - len(self.active_scenes),
+            'terrain_packed': sum(1 for scene in self.scenes.values() if scene.packed_terrain is not None),
+            'hibernations': self.scene_hibernations,
+            'wakes': self.scene_wakes,
+            'catchup_steps': self.scene_catchup_steps
+        }
+    def owns_scene(self, sx, sy):
+        return scene_shard(sx, sy, self.shard_count) == self.shard_index
+    def load_player_data(self, sid):
         name = get_player_name(sid)
         p_db_data = None
         conn = get_db_connection()
@@ -740,23 +1612,25 @@ class GameManager:
             except Exception as e:
                 app.logger.error(f"Error loading player {name}({sid}) from DB: {e}",exc_info=True)
             finally:
-                if conn:
-                    conn.close()
+                release_db_connection(conn)
+        return p_db_data
+    def add_player(self, sid, p_db_data = None):
+        name = get_player_name(sid)
+        if p_db_data is None:
+            p_db_data = self.load_player_data(sid)
         player = Player(sid, name, db_data = p_db_data)
         if not p_db_data:
             player.save_to_db()
             app.logger.info(f"Created new player {name}({sid}) and saved to DB.")
         self.players[sid] = player
+        self.client_sync[sid] = ClientSyncState()
         scene = self.get_or_create_scene(player.scene_x, player.scene_y)
-        scene.add_player(sid)
+        scene.add_player(player)
         player.visible_tiles_cache = self.calculate_fov(player.x, player.y, scene, SENSE_SIGHT_RANGE)
         app.logger.info(f"Player {name} added to scene({player.scene_x}, {player.scene_y}). Total players: {len(self.players)}")
-        new_p_data = player.get_public_data()
-        for osid in scene.get_player_sids():
-            if osid != sid:
-                op = self.get_player(osid)
-                if op and self.is_player_visible_to_observer(op,player):
-                    self.socketio.emit('player_entered_your_scene', new_p_data, room = osid)
+        self.join_scene_room(sid, player.scene_x, player.scene_y)
+        self.announce_player_entered(player, scene)
+        self.prefetch_scenes_around(player.scene_x, player.scene_y)
         return player
     def remove_player(self, sid):
         player = self.players.get(sid)
@@ -764,16 +1638,17 @@ class GameManager:
             player.save_to_db()
             app.logger.info(f"Player {player.name} state saved on disconnect.")
         player = self.players.pop(sid, None)
-        if sid in self.queued_actions:
-            del self.queued_actions[sid]
+        self.action_queues.pop(sid, None)
+        self.client_sync.pop(sid, None)
         if player:
             osc = (player.scene_x, player.scene_y)
             if osc in self.scenes:
                 scene = self.scenes[osc]
                 scene.remove_player(sid)
                 app.logger.info(f"Removed {player.name} from scene {osc}. Players in scene: {len(scene.get_player_sids())}")
-                for osid in scene.get_player_sids():
-                    self.socketio.emit('player_exited_your_scene', {'id': sid, 'name': player.name}, room = osid)
+                self.leave_scene_room(sid, *osc)
+                if len(scene.player_index):
+                    self.socketio.emit('player_exited_your_scene', {'id': sid, 'name': player.name}, room = scene_room(*osc))
             return player
         return None
     def get_player(self, sid):
@@ -781,15 +1656,11 @@ class GameManager:
     def get_npc(self, nid):
         return self.all_npcs.get(nid)
     def get_npc_at(self, x, y, sx, sy):
-        for npc_obj in self.all_npcs.values():
-            if npc_obj.scene_x == sx and npc_obj.scene_y == sy and npc_obj.x == x and npc_obj.y == y:
-                return npc_obj
-        return None
+        scene = self.scenes.get((sx, sy))
+        return scene.get_npc_at(x, y) if scene else None
     def get_player_at(self, x, y, sx, sy):
-        for p_obj in self.players.values():
-            if p_obj.scene_x == sx and p_obj.scene_y == sy and p_obj.x == x and p_obj.y == y:
-                return p_obj
-        return None
+        scene = self.scenes.get((sx, sy))
+        return scene.get_player_at(x, y) if scene else None
     def handle_player_scene_change(self, player, osx, osy):
         old_sc = (osx, osy)
         new_sc = (player.scene_x, player.scene_y)
@@ -798,18 +1669,140 @@ class GameManager:
                 old_so = self.scenes[old_sc]
                 old_so.remove_player(player.id)
                 app.logger.info(f"Player {player.name} left scene {old_sc}.")
-                for osid in old_so.get_player_sids():
-                    self.socketio.emit('player_exited_your_scene', {'id': player.id, 'name': player.name}, room = osid)
+                self.leave_scene_room(player.id, *old_sc)
+                if len(old_so.player_index):
+                    self.socketio.emit('player_exited_your_scene', {'id': player.id, 'name': player.name}, room = scene_room(*old_sc))
+            if not self.owns_scene(*new_sc):
+                self.hand_off_player(player)
+                return
             new_so = self.get_or_create_scene(player.scene_x, player.scene_y)
-            new_so.add_player(player.id)
+            new_so.add_player(player)
             player.visible_tiles_cache = self.calculate_fov(player.x, player.y, new_so, SENSE_SIGHT_RANGE)
             app.logger.info(f"Player {player.name} entered scene {new_sc}. Terrain: {new_so.name}")
-            p_pdata = player.get_public_data()
-            for osid in new_so.get_player_sids():
-                if osid != player.id:
-                    op = self.get_player(osid)
-                    if op and self.is_player_visible_to_observer(op, player):
-                        self.socketio.emit('player_entered_your_scene', p_pdata, room = osid)
+            self.join_scene_room(player.id, *new_sc)
+            self.announce_player_entered(player, new_so)
+            self.prefetch_scenes_around(*new_sc)
+    def room_member_reachable(self, sid):
+        # With a message queue the manager publishes room changes for sockets held by other workers, so only
+        # a single-process manager can tell here that a SID is gone. Checked first there: for an unknown SID
+        # enter_room raises only after creating the room, leaving it behind empty.
+        manager = self.socketio.server.manager
+        return isinstance(manager, socketio.PubSubManager) or manager.is_connected(sid, '/')
+    def join_scene_room(self, sid, sx, sy):
+        if not self.room_member_reachable(sid): # Socket already gone, or never connected (bench.py players)
+            app.logger.debug(f"SID {sid} not connected; not joining {scene_room(sx, sy)}.")
+            return
+        try:
+            self.socketio.server.enter_room(sid, scene_room(sx, sy), namespace = '/')
+        except (KeyError, ValueError):
+            app.logger.debug(f"SID {sid} not connected; not joining {scene_room(sx, sy)}.")
+    def leave_scene_room(self, sid, sx, sy):
+        if not self.room_member_reachable(sid):
+            app.logger.debug(f"SID {sid} not connected; not leaving {scene_room(sx, sy)}.")
+            return
+        try:
+            self.socketio.server.leave_room(sid, scene_room(sx, sy), namespace = '/')
+        except (KeyError, ValueError):
+            app.logger.debug(f"SID {sid} not connected; not leaving {scene_room(sx, sy)}.")
+    def announce_player_entered(self, player, scene):
+        # One emit to the scene room, skipping the newcomer and anyone who can't see where they stand.
+        sids = scene.get_player_sids()
+        unseen = [osid for osid in sids if not self.is_player_visible_to_observer(self.get_player(osid), player)]
+        if len(unseen) < len(sids):
+            self.socketio.emit('player_entered_your_scene', player.get_public_data(), room = scene_room(scene.scene_x, scene.scene_y), skip_sid = unseen)
+    def hand_off_player(self, player):
+        # The player walked into a scene another shard owns: drop it here and let the owner re-add it from this state.
+        shard = scene_shard(player.scene_x, player.scene_y, self.shard_count)
+        sync = self.client_sync.pop(player.id, None)
+        self.players.pop(player.id, None)
+        self.action_queues.pop(player.id, None)
+        self.remote_owner[player.id] = shard
+        player.save_to_db()
+        options = {'delta_updates': sync.supports_deltas, 'tile_encoding': sync.tile_encoding} if sync else None
+        self.shard_bus.publish(shard, {'type': 'handoff', 'sid': player.id, 'state': player.get_state(), 'options': options})
+        app.logger.info(f"Player {player.name} handed off to shard {shard} for scene ({player.scene_x}, {player.scene_y}).")
+    def forward_to_owner(self, message):
+        shard = self.remote_owner.get(message['sid'])
+        hops = message.get('hops', 0)
+        if shard is None or shard == self.shard_index or hops >= self.shard_count:
+            app.logger.warning(f"Shard {self.shard_index}: dropping {message.get('type')} for SID {message['sid']} with no known owner.")
+            return
+        message['hops'] = hops + 1
+        self.shard_bus.publish(shard, message)
+    def apply_client_options(self, sid, data):
+        sync = self.client_sync.get(sid)
+        if sync and isinstance(data, dict):
+            sync.supports_deltas = bool(data.get('delta_updates'))
+            if data.get('tile_encoding') in TILE_ENCODINGS:
+                sync.tile_encoding = data['tile_encoding']
+    def deliver_shout(self, chat_data, sx, sy):
+        # The 3x3 block of scene rooms around the shouter; through the message queue this reaches clients on every worker.
+        self.wake_scenes_around(sx, sy)
+        self.socketio.emit('chat_message', chat_data, room = [scene_room(sx + dx, sy + dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)])
+    def wake_scenes_around(self, sx, sy):
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                scene = self.scenes.get((sx + dx, sy + dy))
+                if scene and scene.hibernating:
+                    self.wake_scene(scene)
+    def handle_shard_message(self, message):
+        with app.app_context():
+            kind = message.get('type')
+            sid = message.get('sid')
+            if kind in ('join', 'handoff'):
+                player = self.add_player(sid, message.get('state'))
+                self.remote_owner.pop(sid, None)
+                if message.get('options'):
+                    self.apply_client_options(sid, message['options'])
+                if kind == 'join':
+                    self.send_initial_game_data(player)
+                else:
+                    self.shard_bus.broadcast({'type': 'owner', 'sid': sid, 'shard': self.shard_index})
+            elif kind == 'owner':
+                if message['shard'] == self.shard_index:
+                    self.remote_owner.pop(sid, None)
+                elif sid in self.local_sids or sid in self.remote_owner:
+                    self.remote_owner[sid] = message['shard']
+            elif kind == 'leave':
+                self.remote_owner.pop(sid, None)
+                if sid in self.players:
+                    self.remove_player(sid)
+            elif kind == 'shout':
+                if message['origin'] != self.shard_index:
+                    self.wake_scenes_around(*message['scene']) # The origin shard already emitted to the scene rooms
+            elif sid not in self.players:
+                self.forward_to_owner(message)
+            elif kind == 'action':
+                if not (FAST_ACTIONS and self.try_fast_action(self.players[sid], message['action'])):
+                    self.action_queue(sid).push(message['action'])
+            elif kind == 'client_options':
+                self.apply_client_options(sid, message['options'])
+            elif kind == 'full_sync':
+                sync = self.client_sync.get(sid)
+                if sync:
+                    sync.last_view = None
+    def send_initial_game_data(self, player):
+        view = self.build_client_view(player)
+        full = self.full_payload_from_view(view)
+        self.client_sync[player.id].last_view = view
+        initial_game_data = {
+            'player_data': full['self_player_data'],
+            'other_players_in_scene': full['visible_other_players'],
+            'visible_npcs': full['visible_npcs'],
+            'visible_trees': full['visible_trees'],
+            'visible_terrain': full['visible_terrain'],
+            'all_visible_tiles': full['all_visible_tiles'],
+            'supports_delta_updates': True,
+            'tile_encodings': list(TILE_ENCODINGS),
+            'grid_width': GRID_WIDTH,
+            'grid_height': GRID_HEIGHT,
+            'tick_rate': GAME_HEARTBEAT_RATE,
+            'default_rain_intensity': DEFAULT_RAIN_INTENSITY,
+            'tree_char': TREE_CHAR,
+            'elf_char': ELF_CHAR
+        }
+        self.socketio.emit('initial_game_data', initial_game_data, room = player.id)
+        self.socketio.emit('lore_message', {'messageKey': "LORE.WELCOME_INITIAL", 'type': 'welcome-message'}, room = player.id)
     def is_player_visible_to_observer(self, obs_p, target_p):
         if not obs_p or not target_p:
             return False
@@ -826,31 +1819,86 @@ class GameManager:
         if hasattr(target_npc, 'is_sneaking') and target_npc.is_sneaking:
             return False
         return (target_npc.x, target_npc.y) in obs_p.visible_tiles_cache
-    def get_visible_players_for_observer(self, obs_p):
-        vo=[]
-        scene = self.get_or_create_scene(obs_p.scene_x, obs_p.scene_y)
-        for tsid in scene.get_player_sids():
-            if tsid == obs_p.id:
-                continue
-            tp = self.get_player(tsid)
-            if tp and (tp.x, tp.y) in obs_p.visible_tiles_cache:
-                vo.append(tp.get_public_data())
-        return vo
-    def get_visible_npcs_for_observer(self, obs_p):
-        vnd=[]
-        scene = self.get_or_create_scene(obs_p.scene_x, obs_p.scene_y)
-        for nid in scene.get_npc_ids():
-            npc = self.get_npc(nid)
-            if not npc:
-                continue
+    def get_visible_players_for_observer(self, obs_p, snapshot = None):
+        snapshot = snapshot or self.build_scene_snapshot(self.get_or_create_scene(obs_p.scene_x, obs_p.scene_y))
+        tiles = obs_p.visible_tiles_cache
+        return [data for x, y, pid, data in snapshot.players if pid != obs_p.id and (x, y) in tiles]
+    def get_visible_npcs_for_observer(self, obs_p, snapshot = None):
+        snapshot = snapshot or self.build_scene_snapshot(self.get_or_create_scene(obs_p.scene_x, obs_p.scene_y))
+        tiles = obs_p.visible_tiles_cache
+        return [data for x, y, data in snapshot.npcs if (x, y) in tiles]
+    def build_scene_snapshot(self, scene):
+        snapshot = SceneSnapshot()
+        for p in scene.player_index.entities():
+            snapshot.players.append((p.x, p.y, p.id, p.get_public_data()))
+        for npc in scene.npc_index.entities():
             if isinstance(npc, Elf) and npc.home_tree_id:
                 ht = self.get_tree(npc.home_tree_id)
                 npc.is_hidden_by_tree = bool(ht and not ht.is_chopped_down and npc.x == ht.x and npc.y == ht.y)
             else:
                 npc.is_hidden_by_tree = False # Not strictly needed if client checks attribute existence
-            if self.is_npc_visible_to_observer(obs_p, npc):
-                vnd.append(npc.get_public_data())
-        return vnd
+            if hasattr(npc, 'is_sneaking') and npc.is_sneaking:
+                continue
+            snapshot.npcs.append((npc.x, npc.y, npc.get_public_data()))
+        for tree in scene.tree_index.entities():
+            snapshot.trees.append((tree.x, tree.y, tree.get_public_data()))
+        return snapshot
+    def build_client_view(self, player, snapshot = None):
+        scene = self.get_or_create_scene(player.scene_x, player.scene_y)
+        snapshot = snapshot or self.build_scene_snapshot(scene)
+        walls, water = scene.get_visible_terrain_tiles(player.visible_tiles_cache)
+        return {
+            'self': player.get_full_data(),
+            'players': {d['id']: d for d in self.get_visible_players_for_observer(player, snapshot)},
+            'npcs': {d['id']: d for d in self.get_visible_npcs_for_observer(player, snapshot)},
+            'trees': {d['id']: d for d in self.get_visible_trees_for_observer(player, snapshot)},
+            'tiles': player.visible_tiles_cache,
+            'walls': walls,
+            'water': water
+        }
+    def full_payload_from_view(self, view, tile_encoding = 'list'):
+        payload = {
+            'self_player_data': view['self'],
+            'visible_other_players': list(view['players'].values()),
+            'visible_npcs': list(view['npcs'].values()),
+            'visible_trees': list(view['trees'].values())
+        }
+        payload.update(view_tiles_payload(view, tile_encoding))
+        return payload
+    def diff_client_views(self, old, new, tile_encoding = 'list'):
+        delta = {}
+        self_changes = {k: v for k, v in new['self'].items() if old['self'].get(k) != v}
+        if self_changes:
+            delta['self_changes'] = self_changes
+        for kind in ('players', 'npcs', 'trees'):
+            old_entities, new_entities = old[kind], new[kind]
+            upsert = [d for eid, d in new_entities.items() if old_entities.get(eid) != d]
+            remove = [eid for eid in old_entities if eid not in new_entities]
+            if upsert or remove:
+                delta[kind] = {'upsert': upsert, 'remove': remove}
+        changed_tiles = [kind for kind in ('tiles', 'walls', 'water') if old[kind] is not new[kind] and old[kind] != new[kind]]
+        if changed_tiles and tile_encoding == 'bitset':
+            delta.update(view_tiles_payload(new, tile_encoding))
+        else:
+            for kind in changed_tiles:
+                delta[kind] = {'add': tiles_to_payload(new[kind] - old[kind]), 'remove': tiles_to_payload(old[kind] - new[kind])}
+        return delta
+    def send_game_update(self, player, snapshot = None):
+        # Full game_update until the client has opted into deltas and holds a baseline; afterwards only
+        # what changed goes out as game_delta, and nothing at all when the view is unchanged.
+        sync = self.client_sync.get(player.id)
+        view = self.build_client_view(player, snapshot)
+        tile_encoding = sync.tile_encoding if sync else 'list'
+        if sync is None or not sync.supports_deltas or sync.last_view is None:
+            self.socketio.emit('game_update', self.full_payload_from_view(view, tile_encoding), room = player.id)
+        else:
+            delta = self.diff_client_views(sync.last_view, view, tile_encoding)
+            if not delta:
+                return False
+            self.socketio.emit('game_delta', delta, room = player.id)
+        if sync is not None:
+            sync.last_view = view
+        return True
     def get_target_coordinates(self, player, dx, dy):
         return player.x + dx, player.y + dy
     def get_general_direction(self, obs, target):
@@ -873,42 +1921,55 @@ class GameManager:
                 return "to the NorthWest"
             return "nearby"
     def process_sensory_perception(self, player, scene):
+        # NPCs in the player's field of view can be seen; the rest can only be heard, smelt or sensed, and those cues
+        # come straight from the scene's range table for the player's tile. At most one cue per NPC, each cue key once,
+        # and everything perceived goes out in a single lore_messages emit.
+        visible = player.visible_tiles_cache
+        npc_tiles = scene.npc_index.tiles
+        messages = []
         pcts = set()
-        for nid in scene.get_npc_ids():
-            npc = self.get_npc(nid)
-            if not npc or npc.is_hidden:
-                continue
-            if hasattr(npc, 'is_hidden_by_tree') and npc.is_hidden_by_tree:
-                continue
-            is_vis = (npc.x, npc.y) in player.visible_tiles_cache
-            if hasattr(npc, 'is_sneaking') and npc.is_sneaking:
-                is_vis = False
-            dist = abs(player.x - npc.x) + abs(player.y - npc.y)
-            if is_vis:
-                for ck, rel, _ in npc.sensory_cues.get('sight', []):
+        handled = set() # NPCs in view, which are only seen
+        for pos in npc_tiles.keys() & visible:
+            for npc in npc_tiles[pos].values():
+                if npc.is_hidden or npc.is_hidden_by_tree or getattr(npc, 'is_sneaking', False):
+                    continue
+                handled.add(npc.id)
+                for ck, rel, _ in npc.sensory_cues.get('sight', ()):
                     if random.random() < (rel * 0.05) and ck not in pcts:
-                        self.socketio.emit('lore_message', {'messageKey': ck, 'placeholders': {'npcName': npc.name}, 'type': 'sensory-sight'}, room = player.id)
+                        messages.append({'messageKey': ck, 'placeholders': {'npcName': npc.name}, 'type': 'sensory-sight'})
                         pcts.add(ck)
                         break
-            else:
-                for stype in['sound', 'smell', 'magic']:
-                    for ck, rel, crange in npc.sensory_cues.get(stype, []):
-                        if dist <= crange:
-                            pchance = rel * (1 - (dist / (crange + 1.0))) * 0.5
-                            if random.random() < pchance and ck not in pcts:
-                                self.socketio.emit('lore_message', {'messageKey': ck, 'placeholders': {'npcName': npc.name, 'direction': self.get_general_direction(player, npc)}, 'type': f'sensory-{stype}'}, room = player.id)
-                                pcts.add(ck)
-                                break
-                        if ck in pcts:
-                            break
-    def process_actions(self, ):
-        gm = get_game_manager()
-        current_actions_to_process = dict(gm.queued_actions)
-        gm.queued_actions.clear()
-        processed_sids = set()
-        for sid_action, action_data in current_actions_to_process.items():
-            if sid_action in processed_sids:
+        for npc, cues in scene.get_sensory_table().get((player.x, player.y), ()):
+            if npc.id in handled or npc.is_hidden or npc.is_hidden_by_tree:
                 continue
+            for stype, ck, pchance in cues:
+                if random.random() < pchance and ck not in pcts:
+                    messages.append({'messageKey': ck, 'placeholders': {'npcName': npc.name, 'direction': self.get_general_direction(player, npc)}, 'type': f'sensory-{stype}'})
+                    pcts.add(ck)
+                    break
+        if messages:
+            self.socketio.emit('lore_messages', {'messages': messages}, room = player.id)
+    def action_queue(self, sid):
+        queue = self.action_queues.get(sid)
+        if queue is None:
+            queue = self.action_queues[sid] = ActionQueue()
+        return queue
+    def get_action_stats(self):
+        totals = Counter()
+        for queue in self.action_queues.values():
+            totals.update(queue.get_stats())
+        worst = sorted(self.action_queues.items(), key = lambda item: item[1].rate_limited + item[1].overflowed, reverse = True)[:10]
+        return dict(totals, top_droppers = {sid: queue.get_stats() for sid, queue in worst if queue.rate_limited or queue.overflowed})
+    def process_actions(self, ):
+        gm = self
+        current_actions_to_process = [] # Up to ACTIONS_PER_TICK per player, taken round-robin so nobody goes twice before everyone went once
+        since = gm.loop_iteration_count - 1 # Fast actions applied since the last tick already spent part of the budget
+        for turn in range(ACTIONS_PER_TICK):
+            taken = [(sid, queue.actions.popleft()) for sid, queue in gm.action_queues.items() if queue.actions and turn >= queue.fast_used_since(since)]
+            if not taken:
+                break
+            current_actions_to_process.extend(taken)
+        for sid_action, action_data in current_actions_to_process:
             player = gm.get_player(sid_action)
             if not player:
                 app.logger.warning(f"Action from non-existent player SID {sid_action}")
@@ -917,127 +1978,160 @@ class GameManager:
             details = action_data.get('details', {})
             app.logger.debug(f"Processing action for {player.name}: {action_type} with details {details}")
             scene_of_player = gm.get_or_create_scene(player.scene_x, player.scene_y)
-            if action_type == 'move' or action_type == 'look':
-                dx, dy = details.get('dx', 0), details.get('dy', 0)
-                new_char_for_player = details.get('newChar', player.char)
-                if action_type == 'move':
-                    target_x, target_y = player.x + dx, player.y + dy
-                    can_move_to_tile = True
-                    if 0 <= target_x < GRID_WIDTH and 0 <= target_y < GRID_HEIGHT:
-                        if not scene_of_player.is_walkable(target_x, target_y):
-                            gm.socketio.emit('lore_message', {'messageKey': 'LORE.ACTION_BLOCKED_WALL', 'type': 'event-bad'}, room=player.id); can_move_to_tile = False # Generic blocked message
-                        else:
-                            npc_at_target = gm.get_npc_at(target_x, target_y, player.scene_x, player.scene_y)
-                            if npc_at_target and isinstance(npc_at_target, ManaPixie):
-                                if npc_at_target.attempt_evade(player.x, player.y, scene_of_player):
-                                    gm.socketio.emit('lore_message', {'messageKey': 'LORE.PIXIE_MOVED_AWAY', 'type': 'system', 'placeholders':{'pixieName': npc_at_target.name}}, room=player.id)
-                                else:
-                                    gm.socketio.emit('lore_message', {'messageKey': 'LORE.PIXIE_BLOCKED_PATH', 'type': 'event-bad', 'placeholders':{'pixieName': npc_at_target.name}}, room=player.id); can_move_to_tile = False
-                            elif npc_at_target :
-                                 gm.socketio.emit('lore_message', {'messageKey': 'LORE.NPC_BLOCKED_PATH', 'type': 'event-bad', 'placeholders':{'npcName': npc_at_target.name}}, room=player.id); can_move_to_tile = False
-                            elif scene_of_player.get_tile_type(target_x, target_y) == TILE_WATER:
-                                player.set_wet_status(True, gm.socketio, reason = "water_tile")
-                    if can_move_to_tile:
-                         player.update_position(dx, dy, new_char_for_player, gm, gm.socketio)
-                    elif player.char != new_char_for_player:
-                        player.char = new_char_for_player
-                        player.visible_tiles_cache = gm.calculate_fov(player.x, player.y, scene_of_player, SENSE_SIGHT_RANGE)
-                elif action_type == 'look':
-                    if player.char != new_char_for_player: player.char = new_char_for_player
+            with scene_of_player.lock:
+                gm.apply_action(player, scene_of_player, action_type, details)
+    def try_fast_action(self, player, action_data):
+        # FAST_ACTIONS: apply a move or look straight away on the handler greenlet when it can't contend with anything:
+        # nothing queued ahead of it, budget left in the next tick's ACTIONS_PER_TICK, the scene awake and not being
+        # worked on by the tick, and for a move a walkable, unoccupied floor tile inside the same scene. Returns False
+        # to leave the action to the tick.
+        action_type = action_data.get('type')
+        details = action_data.get('details') or {}
+        if action_type not in ('move', 'look') or not isinstance(details, dict):
+            return False
+        if any(type(details.get(k, 0)) is not int or not -1 <= details.get(k, 0) <= 1 for k in ('dx', 'dy')):
+            return False
+        queue = self.action_queue(player.id)
+        scene = self.scenes.get((player.scene_x, player.scene_y))
+        if queue.actions or queue.fast_used_since(self.loop_iteration_count) >= ACTIONS_PER_TICK or scene is None or scene.hibernating:
+            return False
+        if not scene.lock.acquire(blocking = False):
+            return False
+        try:
+            old_pos = (player.x, player.y)
+            if action_type == 'move':
+                tx, ty = player.x + details.get('dx', 0), player.y + details.get('dy', 0)
+                if not (0 <= tx < GRID_WIDTH and 0 <= ty < GRID_HEIGHT) or not scene.is_walkable(tx, ty):
+                    return False
+                if scene.get_tile_type(tx, ty) != TILE_FLOOR or scene.is_npc_at(tx, ty) or scene.is_player_at(tx, ty):
+                    return False
+            self.apply_action(player, scene, action_type, details)
+            self.fast_actions += 1
+            queue.charge_fast(self.loop_iteration_count)
+        finally:
+            scene.lock.release()
+        self.send_fast_update(player, scene, old_pos)
+        return True
+    def send_fast_update(self, player, scene, old_pos):
+        # Updates for the mover and for anyone in the scene who could see its old or new tile.
+        snapshot = self.build_scene_snapshot(scene)
+        self.send_game_update(player, snapshot)
+        for osid in scene.get_player_sids():
+            op = self.get_player(osid)
+            if op and op is not player and (old_pos in op.visible_tiles_cache or (player.x, player.y) in op.visible_tiles_cache):
+                self.send_game_update(op, snapshot)
+    def apply_action(self, player, scene_of_player, action_type, details):
+        gm = self
+        if action_type == 'move' or action_type == 'look':
+            dx, dy = details.get('dx', 0), details.get('dy', 0)
+            new_char_for_player = details.get('newChar', player.char)
+            if action_type == 'move':
+                target_x, target_y = player.x + dx, player.y + dy
+                can_move_to_tile = True
+                if 0 <= target_x < GRID_WIDTH and 0 <= target_y < GRID_HEIGHT:
+                    if not scene_of_player.is_walkable(target_x, target_y):
+                        gm.socketio.emit('lore_message', {'messageKey': 'LORE.ACTION_BLOCKED_WALL', 'type': 'event-bad'}, room=player.id); can_move_to_tile = False # Generic blocked message
+                    else:
+                        npc_at_target = gm.get_npc_at(target_x, target_y, player.scene_x, player.scene_y)
+                        if npc_at_target and isinstance(npc_at_target, ManaPixie):
+                            if npc_at_target.attempt_evade(player.x, player.y, scene_of_player):
+                                gm.socketio.emit('lore_message', {'messageKey': 'LORE.PIXIE_MOVED_AWAY', 'type': 'system', 'placeholders':{'pixieName': npc_at_target.name}}, room=player.id)
+                            else:
+                                gm.socketio.emit('lore_message', {'messageKey': 'LORE.PIXIE_BLOCKED_PATH', 'type': 'event-bad', 'placeholders':{'pixieName': npc_at_target.name}}, room=player.id); can_move_to_tile = False
+                        elif npc_at_target :
+                             gm.socketio.emit('lore_message', {'messageKey': 'LORE.NPC_BLOCKED_PATH', 'type': 'event-bad', 'placeholders':{'npcName': npc_at_target.name}}, room=player.id); can_move_to_tile = False
+                        elif scene_of_player.get_tile_type(target_x, target_y) == TILE_WATER:
+                            player.set_wet_status(True, gm.socketio, reason = "water_tile")
+                if can_move_to_tile:
+                     player.update_position(dx, dy, new_char_for_player, gm, gm.socketio)
+                elif player.char != new_char_for_player:
+                    player.char = new_char_for_player
                     player.visible_tiles_cache = gm.calculate_fov(player.x, player.y, scene_of_player, SENSE_SIGHT_RANGE)
-                    gm.process_sensory_perception(player, scene_of_player)
-            elif action_type == 'chop_tree':
-                dx, dy = details.get('dx', 0), details.get('dy', 0)
-                target_x, target_y = gm.get_target_coordinates(player, dx, dy)
-                tree_to_chop = gm.get_tree_at(target_x, target_y, player.scene_x, player.scene_y)
-                if not tree_to_chop:
-                    gm.socketio.emit('lore_message', {'messageKey': 'LORE.CHOP_FAIL_NO_TREE', 'type': 'event-bad'}, room=player.id)
-                elif tree_to_chop.is_chopped_down:
-                    gm.socketio.emit('lore_message', {'messageKey': 'LORE.CHOP_FAIL_ALREADY_CHOPPED', 'type': 'event-bad'}, room=player.id)
-                elif not player.can_afford_mana(CHOP_TREE_MANA_COST):
-                    gm.socketio.emit('lore_message', {'messageKey': 'LORE.CHOP_FAIL_NO_MANA', 'placeholders': {'manaCost': CHOP_TREE_MANA_COST}, 'type': 'event-bad'}, room=player.id)
-                else:
-                    player.spend_mana(CHOP_TREE_MANA_COST)
-                    tree_to_chop.is_chopped_down = True
-                    tree_to_chop.save_to_db()
-                    gm.socketio.emit('lore_message', {'messageKey': 'LORE.CHOP_SUCCESS', 'placeholders': {'treeName': tree_to_chop.name, 'manaCost': CHOP_TREE_MANA_COST}, 'type': 'event-good'}, room=player.id)
-                    for elf_id in tree_to_chop.elf_guardian_ids:
-                        elf = gm.get_npc(elf_id)
-                        if elf and isinstance(elf, Elf):
-                            elf.state = "distressed_no_tree"
-                            gm.socketio.emit('lore_message', {'messageKey': 'LORE.ELF_TREE_DESTROYED_REACTION', 'placeholders': {'elfName': elf.name, 'treeName': tree_to_chop.lore_name}, 'type': 'system-event-negative'}, room=player.id)
-                    for p_sid in scene_of_player.get_player_sids():
-                        p = gm.get_player(p_sid)
-                        if p:
-                            p.visible_tiles_cache = gm.calculate_fov(p.x, p.y, scene_of_player, SENSE_SIGHT_RANGE)
-            elif action_type == 'build_wall':
-                dx, dy = details.get('dx', 0), details.get('dy', 0)
-                target_x, target_y = gm.get_target_coordinates(player, dx, dy)
-                if not (0 <= target_x < GRID_WIDTH and 0 <= target_y < GRID_HEIGHT):
-                    gm.socketio.emit('lore_message', {'messageKey': 'LORE.BUILD_FAIL_OUT_OF_BOUNDS', 'type': 'event-bad'}, room = player.id)
-                elif not scene_of_player.is_walkable(target_x, target_y) or scene_of_player.get_tile_type(target_x, target_y) != TILE_FLOOR:
-                    gm.socketio.emit('lore_message', {'messageKey': 'LORE.BUILD_FAIL_OBSTRUCTED', 'type': 'event-bad'}, room = player.id)
-                elif gm.get_npc_at(target_x, target_y, player.scene_x, player.scene_y) or gm.get_player_at(target_x, target_y, player.scene_x, player.scene_y):
-                    gm.socketio.emit('lore_message', {'messageKey': 'LORE.BUILD_FAIL_OBSTRUCTED', 'type': 'event-bad'}, room = player.id)
-                elif not player.has_wall_items():
-                    gm.socketio.emit('lore_message', {'messageKey': 'LORE.BUILD_FAIL_NO_MATERIALS', 'type': 'event-bad'}, room = player.id)
-                else:
-                    player.use_wall_item()
-                    scene_of_player.set_tile_type(target_x, target_y, TILE_WALL)
-                    gm.socketio.emit('lore_message', {'messageKey': 'LORE.BUILD_SUCCESS', 'placeholders': {'walls': player.walls}, 'type': 'event-good'}, room = player.id)
-                    for p_sid in scene_of_player.get_player_sids():
-                        p = gm.get_player(p_sid)
-                        if p:
-                            p.visible_tiles_cache = gm.calculate_fov(p.x, p.y, scene_of_player, SENSE_SIGHT_RANGE)
-            elif action_type == 'destroy_wall':
-                dx, dy = details.get('dx', 0), details.get('dy', 0)
-                target_x, target_y = gm.get_target_coordinates(player, dx, dy)
-                if not (0 <= target_x < GRID_WIDTH and 0 <= target_y < GRID_HEIGHT):
-                    gm.socketio.emit('lore_message', {'messageKey': 'LORE.DESTROY_FAIL_OUT_OF_BOUNDS', 'type': 'event-bad'}, room = player.id)
-                elif scene_of_player.get_tile_type(target_x, target_y) != TILE_WALL:
-                    gm.socketio.emit('lore_message', {'messageKey': 'LORE.DESTROY_FAIL_NO_WALL', 'type': 'event-bad'}, room = player.id)
-                elif not player.can_afford_mana(DESTROY_WALL_MANA_COST):
-                    gm.socketio.emit('lore_message', {'messageKey': 'LORE.DESTROY_FAIL_NO_MANA', 'placeholders': {'manaCost': DESTROY_WALL_MANA_COST}, 'type': 'event-bad'}, room = player.id)
-                else:
-                    player.spend_mana(DESTROY_WALL_MANA_COST); player.add_wall_item(); scene_of_player.set_tile_type(target_x, target_y, TILE_FLOOR)
-                    gm.socketio.emit('lore_message', {'messageKey': 'LORE.DESTROY_SUCCESS', 'placeholders': {'walls': player.walls, 'manaCost': DESTROY_WALL_MANA_COST}, 'type': 'event-good'}, room = player.id)
-                    for p_sid in scene_of_player.get_player_sids():
-                        p = gm.get_player(p_sid)
-                        if p:
-                            p.visible_tiles_cache = gm.calculate_fov(p.x, p.y, scene_of_player, SENSE_SIGHT_RANGE)
-            elif action_type == 'drink_potion':
-                player.drink_potion(gm.socketio)
-            elif action_type == 'say':
-                message_text = details.get('message', '')
-                if message_text:
+            elif action_type == 'look':
+                if player.char != new_char_for_player: player.char = new_char_for_player
+                player.visible_tiles_cache = gm.calculate_fov(player.x, player.y, scene_of_player, SENSE_SIGHT_RANGE)
+                gm.process_sensory_perception(player, scene_of_player)
+        elif action_type == 'chop_tree':
+            dx, dy = details.get('dx', 0), details.get('dy', 0)
+            target_x, target_y = gm.get_target_coordinates(player, dx, dy)
+            tree_to_chop = gm.get_tree_at(target_x, target_y, player.scene_x, player.scene_y)
+            if not tree_to_chop:
+                gm.socketio.emit('lore_message', {'messageKey': 'LORE.CHOP_FAIL_NO_TREE', 'type': 'event-bad'}, room=player.id)
+            elif tree_to_chop.is_chopped_down:
+                gm.socketio.emit('lore_message', {'messageKey': 'LORE.CHOP_FAIL_ALREADY_CHOPPED', 'type': 'event-bad'}, room=player.id)
+            elif not player.can_afford_mana(CHOP_TREE_MANA_COST):
+                gm.socketio.emit('lore_message', {'messageKey': 'LORE.CHOP_FAIL_NO_MANA', 'placeholders': {'manaCost': CHOP_TREE_MANA_COST}, 'type': 'event-bad'}, room=player.id)
+            else:
+                player.spend_mana(CHOP_TREE_MANA_COST)
+                tree_to_chop.is_chopped_down = True
+                scene_of_player.refresh_tile_masks(tree_to_chop.x, tree_to_chop.y)
+                tree_to_chop.save_to_db()
+                gm.socketio.emit('lore_message', {'messageKey': 'LORE.CHOP_SUCCESS', 'placeholders': {'treeName': tree_to_chop.name, 'manaCost': CHOP_TREE_MANA_COST}, 'type': 'event-good'}, room=player.id)
+                for elf_id in tree_to_chop.elf_guardian_ids:
+                    elf = gm.get_npc(elf_id)
+                    if elf and isinstance(elf, Elf):
+                        elf.state = "distressed_no_tree"
+                        gm.socketio.emit('lore_message', {'messageKey': 'LORE.ELF_TREE_DESTROYED_REACTION', 'placeholders': {'elfName': elf.name, 'treeName': tree_to_chop.lore_name}, 'type': 'system-event-negative'}, room=player.id)
+                gm.refresh_fov_after_terrain_change(scene_of_player, target_x, target_y)
+        elif action_type == 'build_wall':
+            dx, dy = details.get('dx', 0), details.get('dy', 0)
+            target_x, target_y = gm.get_target_coordinates(player, dx, dy)
+            if not (0 <= target_x < GRID_WIDTH and 0 <= target_y < GRID_HEIGHT):
+                gm.socketio.emit('lore_message', {'messageKey': 'LORE.BUILD_FAIL_OUT_OF_BOUNDS', 'type': 'event-bad'}, room = player.id)
+            elif not scene_of_player.is_walkable(target_x, target_y) or scene_of_player.get_tile_type(target_x, target_y) != TILE_FLOOR:
+                gm.socketio.emit('lore_message', {'messageKey': 'LORE.BUILD_FAIL_OBSTRUCTED', 'type': 'event-bad'}, room = player.id)
+            elif gm.get_npc_at(target_x, target_y, player.scene_x, player.scene_y) or gm.get_player_at(target_x, target_y, player.scene_x, player.scene_y):
+                gm.socketio.emit('lore_message', {'messageKey': 'LORE.BUILD_FAIL_OBSTRUCTED', 'type': 'event-bad'}, room = player.id)
+            elif not player.has_wall_items():
+                gm.socketio.emit('lore_message', {'messageKey': 'LORE.BUILD_FAIL_NO_MATERIALS', 'type': 'event-bad'}, room = player.id)
+            else:
+                player.use_wall_item()
+                scene_of_player.set_tile_type(target_x, target_y, TILE_WALL)
+                gm.socketio.emit('lore_message', {'messageKey': 'LORE.BUILD_SUCCESS', 'placeholders': {'walls': player.walls}, 'type': 'event-good'}, room = player.id)
+                gm.refresh_fov_after_terrain_change(scene_of_player, target_x, target_y)
+        elif action_type == 'destroy_wall':
+            dx, dy = details.get('dx', 0), details.get('dy', 0)
+            target_x, target_y = gm.get_target_coordinates(player, dx, dy)
+            if not (0 <= target_x < GRID_WIDTH and 0 <= target_y < GRID_HEIGHT):
+                gm.socketio.emit('lore_message', {'messageKey': 'LORE.DESTROY_FAIL_OUT_OF_BOUNDS', 'type': 'event-bad'}, room = player.id)
+            elif scene_of_player.get_tile_type(target_x, target_y) != TILE_WALL:
+                gm.socketio.emit('lore_message', {'messageKey': 'LORE.DESTROY_FAIL_NO_WALL', 'type': 'event-bad'}, room = player.id)
+            elif not player.can_afford_mana(DESTROY_WALL_MANA_COST):
+                gm.socketio.emit('lore_message', {'messageKey': 'LORE.DESTROY_FAIL_NO_MANA', 'placeholders': {'manaCost': DESTROY_WALL_MANA_COST}, 'type': 'event-bad'}, room = player.id)
+            else:
+                player.spend_mana(DESTROY_WALL_MANA_COST); player.add_wall_item(); scene_of_player.set_tile_type(target_x, target_y, TILE_FLOOR)
+                gm.socketio.emit('lore_message', {'messageKey': 'LORE.DESTROY_SUCCESS', 'placeholders': {'walls': player.walls, 'manaCost': DESTROY_WALL_MANA_COST}, 'type': 'event-good'}, room = player.id)
+                gm.refresh_fov_after_terrain_change(scene_of_player, target_x, target_y)
+        elif action_type == 'drink_potion':
+            player.drink_potion(gm.socketio)
+        elif action_type == 'say':
+            message_text = details.get('message', '')
+            if message_text:
+                chat_data = {
+                    'sender_id': player.id,
+                    'sender_name': player.name,
+                    'message': message_text,
+                    'type': 'say',
+                    'scene_coords': f"({player.scene_x}, {player.scene_y})"
+                }
+                gm.socketio.emit('chat_message', chat_data, room = scene_room(player.scene_x, player.scene_y))
+        elif action_type == 'shout':
+            message_text = details.get('message', '')
+            if message_text:
+                if player.spend_mana(SHOUT_MANA_COST):
                     chat_data = {
                         'sender_id': player.id,
                         'sender_name': player.name,
                         'message': message_text,
-                        'type': 'say',
+                        'type': 'shout',
                         'scene_coords': f"({player.scene_x}, {player.scene_y})"
                     }
-                    if (player.scene_x, player.scene_y) in gm.scenes:
-                        for target_sid in scene_of_player.get_player_sids():
-                            gm.socketio.emit('chat_message', chat_data, room = target_sid)
-            elif action_type == 'shout':
-                message_text = details.get('message', '')
-                if message_text:
-                    if player.spend_mana(SHOUT_MANA_COST):
-                        chat_data = {
-                            'sender_id': player.id,
-                            'sender_name': player.name,
-                            'message': message_text,
-                            'type': 'shout',
-                            'scene_coords': f"({player.scene_x}, {player.scene_y})"
-                        }
-                        for target_player_obj in list(gm.players.values()):
-                            if abs(target_player_obj.scene_x - player.scene_x) <= 1 and abs(target_player_obj.scene_y - player.scene_y) <= 1:
-                                gm.socketio.emit('chat_message', chat_data, room = target_player_obj.id)
-                        gm.socketio.emit('lore_message', {'messageKey': 'LORE.VOICE_BOOM_SHOUT', 'placeholders': {'manaCost': SHOUT_MANA_COST}, 'type': 'system'}, room = player.id)
-                    else:
-                        gm.socketio.emit('lore_message', {'messageKey': 'LORE.LACK_MANA_SHOUT', 'placeholders': {'manaCost': SHOUT_MANA_COST}, 'type': 'event-bad'}, room = player.id)
-            processed_sids.add(sid_action)
+                    gm.deliver_shout(chat_data, player.scene_x, player.scene_y)
+                    if gm.shard_bus:
+                        gm.shard_bus.broadcast({'type': 'shout', 'origin': gm.shard_index, 'scene': [player.scene_x, player.scene_y], 'chat': chat_data})
+                    gm.socketio.emit('lore_message', {'messageKey': 'LORE.VOICE_BOOM_SHOUT', 'placeholders': {'manaCost': SHOUT_MANA_COST}, 'type': 'system'}, room = player.id)
+                else:
+                    gm.socketio.emit('lore_message', {'messageKey': 'LORE.LACK_MANA_SHOUT', 'placeholders': {'manaCost': SHOUT_MANA_COST}, 'type': 'event-bad'}, room = player.id)
 
 def get_game_manager():
     global game_manager_instance
@@ -1045,85 +2139,254 @@ def get_game_manager():
         with app.app_context(): # Ensures logging and other app features are available during init
              init_db_tables()
              app.logger.info("Initializing GameManager instance for this worker/process...")
-             game_manager_instance = GameManager(sio_inst = sio)
+             game_manager_instance = GameManager(sio_inst = OutboundBuffer(sio))
     return game_manager_instance
 
+TICK_PHASES = ('process_actions', 'mana_regen', 'rain_wetness', 'sensory', 'hibernation', 'npc_ai', 'emit_updates')
+
+def percentiles(samples, points = (50, 95, 99)):
+    if not samples:
+        return {f"p{p}": 0.0 for p in points}
+    ordered = sorted(samples)
+    last = len(ordered) - 1
+    return {f"p{p}": ordered[min(last, int(round(p / 100 * last)))] for p in points}
+
+class TickTimer:
+    # Times consecutive phases of one tick; each lap() records the time since the previous lap.
+    def __init__(self, stats):
+        self.stats = stats
+        self.mark = time.perf_counter()
+    def lap(self, phase):
+        now = time.perf_counter()
+        self.stats.record_phase(phase, now - self.mark)
+        self.mark = now
+
+class TickStats:
+    # Rolling per-phase and whole-tick timings (seconds) over the last TICK_STATS_WINDOW ticks.
+    def __init__(self, window = TICK_STATS_WINDOW):
+        self.window = window
+        self.phases = {name: deque(maxlen = window) for name in TICK_PHASES}
+        self.ticks = deque(maxlen = window)
+        self.tick_count = 0
+        self.overruns = 0
+        self.worst_tick = 0.0
+        self.last_overrun_phases = {}
+    def start_tick(self):
+        return TickTimer(self)
+    def record_phase(self, phase, seconds):
+        if phase not in self.phases:
+            self.phases[phase] = deque(maxlen = self.window)
+        self.phases[phase].append(seconds)
+    def record_tick(self, seconds):
+        self.ticks.append(seconds)
+        self.tick_count += 1
+        self.worst_tick = max(self.worst_tick, seconds)
+        if seconds > GAME_HEARTBEAT_RATE:
+            self.overruns += 1
+            self.last_overrun_phases = {name: round(samples[-1], 6) for name, samples in self.phases.items() if samples}
+    def get_stats(self):
+        def summarize(samples):
+            summary = {k: round(v * 1000, 3) for k, v in percentiles(samples).items()}
+            summary['mean'] = round(sum(samples) / len(samples) * 1000, 3) if samples else 0.0
+            summary['max'] = round(max(samples) * 1000, 3) if samples else 0.0
+            return summary
+        return {
+            'unit': 'ms',
+            'window': len(self.ticks),
+            'ticks': self.tick_count,
+            'overruns': self.overruns,
+            'heartbeat_ms': GAME_HEARTBEAT_RATE * 1000,
+            'worst_tick_ms': round(self.worst_tick * 1000, 3),
+            'tick': summarize(self.ticks),
+            'phases': {name: summarize(samples) for name, samples in self.phases.items()},
+            'last_overrun_phases_ms': {name: round(v * 1000, 3) for name, v in self.last_overrun_phases.items()}
+        }
+
+class TickProfiler:
+    # SIGPROF sampling profiler: counts the functions on the stack while a tick runs so an overrun can name its hot spots.
+    def __init__(self, interval = TICK_PROFILER_INTERVAL, top = TICK_PROFILER_TOP):
+        self.interval = interval
+        self.top = top
+        self.active = False
+        self.installed = False
+        self.self_samples = Counter()
+        self.total_samples = Counter()
+        self.sample_count = 0
+    def install(self):
+        if self.installed:
+            return True
+        try:
+            signal.signal(signal.SIGPROF, self._on_signal)
+            signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+        except (ValueError, AttributeError, OSError) as e:
+            app.logger.warning(f"Tick profiler unavailable: {e}")
+            return False
+        self.installed = True
+        return True
+    def uninstall(self):
+        if self.installed:
+            signal.setitimer(signal.ITIMER_PROF, 0, 0)
+            signal.signal(signal.SIGPROF, signal.SIG_DFL)
+            self.installed = False
+    def _on_signal(self, signum, frame):
+        if not self.active or frame is None:
+            return
+        self.sample_count += 1
+        self.self_samples[self._label(frame.f_code)] += 1
+        seen = set()
+        while frame is not None:
+            label = self._label(frame.f_code)
+            if label not in seen:
+                seen.add(label)
+                self.total_samples[label] += 1
+            frame = frame.f_back
+    def _label(self, code):
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+    def begin_tick(self):
+        self.self_samples.clear()
+        self.total_samples.clear()
+        self.sample_count = 0
+        self.active = True
+    def end_tick(self):
+        self.active = False
+    def report(self):
+        if not self.sample_count:
+            return "no samples"
+        lines = [f"{self.sample_count} samples every {self.interval * 1000:.1f}ms CPU"]
+        for label, count in self.total_samples.most_common(self.top):
+            lines.append(f"  {count / self.sample_count:6.1%} total {self.self_samples.get(label, 0) / self.sample_count:6.1%} self  {label}")
+        return "\n".join(lines)
+
+class TickScheduler:
+    # Runs registered systems once per tick in priority order (lowest first). A system with period N runs on every Nth
+    # tick; with spread=True it runs every tick instead and is passed part = tick % N, doing 1/N of its work each time.
+    # run() keeps ticks on a fixed grid of time.monotonic() and applies TICK_OVERRUN_POLICY when a tick runs long.
+    def __init__(self, tick_seconds = GAME_HEARTBEAT_RATE, overrun_policy = TICK_OVERRUN_POLICY, max_catchup = TICK_MAX_CATCHUP):
+        self.tick_seconds = tick_seconds
+        self.overrun_policy = overrun_policy
+        self.max_catchup = max_catchup
+        self.systems = [] # (priority, name, fn, period, spread)
+        self.skipped_ticks = 0
+        self.catchup_ticks = 0
+        self.late = deque(maxlen = TICK_STATS_WINDOW) # Seconds each tick started after its slot on the grid
+    def register(self, name, fn, period = 1, priority = 100, spread = False):
+        self.systems.append((priority, name, fn, max(1, period), spread))
+        self.systems.sort(key = lambda system: system[0])
+    def run_tick(self, gm, tick, timer):
+        for _, name, fn, period, spread in self.systems:
+            try:
+                if spread:
+                    fn(gm, tick, tick % period)
+                elif tick % period == 0:
+                    fn(gm, tick)
+            except Exception as e:
+                app.logger.error(f"H_ERR {name}: {e}", exc_info = True)
+            timer.lap(name)
+    def run(self, tick_fn, keep_running):
+        next_at = time.monotonic()
+        while keep_running():
+            self.late.append(max(0.0, time.monotonic() - next_at))
+            tick_fn()
+            next_at += self.tick_seconds
+            behind = time.monotonic() - next_at
+            if behind > 0:
+                missed = int(behind // self.tick_seconds)
+                if self.overrun_policy == 'catchup' and missed < self.max_catchup:
+                    self.catchup_ticks += 1 # Start the next tick now; later ticks keep their slots
+                else:
+                    next_at += missed * self.tick_seconds # The late slot runs now; only slots missed entirely are dropped
+                    self.skipped_ticks += missed
+            eventlet.sleep(max(0.0, next_at - time.monotonic())) # sleep(0) still yields to socket handlers
+    def get_stats(self):
+        return {
+            'overrun_policy': self.overrun_policy,
+            'skipped_ticks': self.skipped_ticks,
+            'catchup_ticks': self.catchup_ticks,
+            'late_ms': {k: round(v * 1000, 3) for k, v in percentiles(self.late).items()},
+            'systems': [{'name': name, 'priority': priority, 'period': period, 'spread': spread} for priority, name, _, period, spread in self.systems]
+        }
+
+tick_stats = TickStats()
+tick_profiler = TickProfiler()
+
 def _game_loop_iteration_content():
     gm = get_game_manager()
     gm.loop_iteration_count += 1
-    loop_count = gm.loop_iteration_count
-    try:
-        gm.process_actions()
-    except Exception as e:
-        app.logger.error(f"H_ERR process_actions: {e}", exc_info = True)
-    try:
-        gm.heartbeats_until_mana_regen -= 1
-        if gm.heartbeats_until_mana_regen <= 0:
-            for p_obj in list(gm.players.values()):
-                boost = 0
-                scene_obj = gm.get_or_create_scene(p_obj.scene_x,p_obj.scene_y)
-                for nid in scene_obj.get_npc_ids():
-                    npc = gm.get_npc(nid)
-                    if npc and isinstance(npc, ManaPixie) and abs(p_obj.x - npc.x) + abs(p_obj.y - npc.y) <= PIXIE_PROXIMITY_FOR_BOOST:
-                        boost += PIXIE_MANA_REGEN_BOOST
-                p_obj.regenerate_mana(BASE_MANA_REGEN_PER_HEARTBEAT_CYCLE, boost, sio)
-            gm.heartbeats_until_mana_regen = HEARTBEATS_PER_MANA_REGEN_CYCLE
-    except Exception as e:
-        app.logger.error(f"H_ERR mana_regen: {e}", exc_info = True)
-    try:
-        if gm.server_is_raining:
-            for p_obj in list(gm.players.values()):
-                scene = gm.get_or_create_scene(p_obj.scene_x,p_obj.scene_y)
-                if not scene.is_indoors and not p_obj.is_wet:
-                    p_obj.set_wet_status(True, sio, "rain")
+    timer = tick_stats.start_tick()
+    gm.socketio.begin_tick()
+    game_scheduler.run_tick(gm, gm.loop_iteration_count, timer)
+
+def _tick_process_actions(gm, loop_count):
+    gm.process_actions()
+
+def _tick_mana_regen(gm, loop_count):
+    for p_obj in list(gm.players.values()):
+        boost = 0
+        scene_obj = gm.get_or_create_scene(p_obj.scene_x,p_obj.scene_y)
+        for nid in scene_obj.get_npc_ids():
+            npc = gm.get_npc(nid)
+            if npc and isinstance(npc, ManaPixie) and abs(p_obj.x - npc.x) + abs(p_obj.y - npc.y) <= PIXIE_PROXIMITY_FOR_BOOST:
+                boost += PIXIE_MANA_REGEN_BOOST
+        p_obj.regenerate_mana(BASE_MANA_REGEN_PER_HEARTBEAT_CYCLE, boost, gm.socketio)
+
+def _tick_rain_wetness(gm, loop_count):
+    if gm.server_is_raining:
         for p_obj in list(gm.players.values()):
-            scene = gm.get_or_create_scene(p_obj.scene_x, p_obj.scene_y)
-            if p_obj.is_wet and (scene.is_indoors or not gm.server_is_raining):
-                p_obj.set_wet_status(False, sio, "indoors_or_dry")
-    except Exception as e:
-        app.logger.error(f"H_ERR rain/wetness: {e}", exc_info = True)
-    try:
-        if loop_count % 5 == 0:
-            for p_obj in list(gm.players.values()):
-                scene = gm.get_or_create_scene(p_obj.scene_x, p_obj.scene_y)
-                if not p_obj.visible_tiles_cache:
-                    p_obj.visible_tiles_cache = gm.calculate_fov(p_obj.x, p_obj.y, scene, SENSE_SIGHT_RANGE)
-                gm.process_sensory_perception(p_obj, scene)
-    except Exception as e:
-        app.logger.error(f"H_ERR sensory: {e}", exc_info = True)
-    try:
-        for npc in list(gm.all_npcs.values()):
-            scene = gm.get_or_create_scene(npc.scene_x, npc.scene_y)
-            if hasattr(npc, 'update_ai'):
-                npc.update_ai(scene, gm)
-            elif hasattr(npc, 'wander'):
-                npc.wander(scene)
-    except Exception as e:
-        app.logger.error(f"H_ERR npc_ai: {e}", exc_info = True)
+            scene = gm.get_or_create_scene(p_obj.scene_x,p_obj.scene_y)
+            if not scene.is_indoors and not p_obj.is_wet:
+                p_obj.set_wet_status(True, gm.socketio, "rain")
+    for p_obj in list(gm.players.values()):
+        scene = gm.get_or_create_scene(p_obj.scene_x, p_obj.scene_y)
+        if p_obj.is_wet and (scene.is_indoors or not gm.server_is_raining):
+            p_obj.set_wet_status(False, gm.socketio, "indoors_or_dry")
+
+def _tick_sensory(gm, loop_count, part):
+    # Spread: each tick covers 1/SENSORY_PERIOD of the players, so every player still gets a pass every SENSORY_PERIOD
+    # ticks without the whole cost landing on one tick, even when everyone stands in the same scene.
+    for p_obj in list(gm.players.values()):
+        if hash(p_obj.id) % SENSORY_PERIOD != part:
+            continue
+        scene = gm.get_or_create_scene(p_obj.scene_x, p_obj.scene_y)
+        if not p_obj.visible_tiles_cache:
+            p_obj.visible_tiles_cache = gm.calculate_fov(p_obj.x, p_obj.y, scene, SENSE_SIGHT_RANGE)
+        gm.process_sensory_perception(p_obj, scene)
+
+def _tick_hibernation(gm, loop_count):
+    gm.update_scene_hibernation()
+
+def _tick_npc_ai(gm, loop_count):
+    for scene in list(gm.active_scenes.values()):
+        gm.step_scene_npcs(scene)
+
+def _tick_emit_updates(gm, loop_count):
     try:
         if gm.players:
             snap = list(gm.players.values())
             updates = 0
+            scene_snapshots = {}
             for rp in snap:
                 if rp.id not in gm.players:
                     continue
-                vis_tiles = [{'x': t[0], 'y': t[1]} for t in rp.visible_tiles_cache]
-                payload = {
-                    'self_player_data': rp.get_full_data(),
-                    'visible_other_players': gm.get_visible_players_for_observer(rp),
-                    'visible_npcs': gm.get_visible_npcs_for_observer(rp),
-                    'visible_trees': gm.get_visible_trees_for_observer(rp),
-                    'visible_terrain': gm.get_or_create_scene(rp.scene_x,rp.scene_y).get_terrain_for_payload(rp.visible_tiles_cache),
-                    'all_visible_tiles': vis_tiles
-                }
-                sio.emit('game_update', payload, room = rp.id)
-                updates += 1
+                scene_key = (rp.scene_x, rp.scene_y)
+                if scene_key not in scene_snapshots:
+                    scene_snapshots[scene_key] = gm.build_scene_snapshot(gm.get_or_create_scene(*scene_key))
+                if gm.send_game_update(rp, scene_snapshots[scene_key]):
+                    updates += 1
             if updates > 0 and loop_count % 20 == 1:
-                app.logger.debug(f"H {loop_count}: Sent 'game_update' to {updates} players.")
+                app.logger.debug(f"H {loop_count}: Sent 'game_update' to {updates} players. FOV cache: {gm.get_fov_cache_stats()} Write-behind: {write_behind_queue.get_stats()} DB pool: {db_pool.get_stats() if db_pool else None}")
             elif len(snap) > 0 and updates == 0 and loop_count % 20 == 1:
                 app.logger.debug(f"H {loop_count}: Players present, NO 'game_update' sent.")
-    except Exception as e:
-        app.logger.error(f"H_ERR emit_updates: {e}", exc_info = True)
+    finally:
+        gm.socketio.flush() # Also sends whatever earlier systems emitted this tick
+
+game_scheduler = TickScheduler()
+game_scheduler.register('process_actions', _tick_process_actions, priority = 10)
+game_scheduler.register('mana_regen', _tick_mana_regen, period = HEARTBEATS_PER_MANA_REGEN_CYCLE, priority = 20)
+game_scheduler.register('rain_wetness', _tick_rain_wetness, priority = 30)
+game_scheduler.register('sensory', _tick_sensory, period = SENSORY_PERIOD, priority = 40, spread = True)
+game_scheduler.register('hibernation', _tick_hibernation, priority = 50)
+game_scheduler.register('npc_ai', _tick_npc_ai, priority = 60)
+game_scheduler.register('emit_updates', _tick_emit_updates, priority = 90)
 
 def _persistent_game_loop_runner():
     gm = get_game_manager()
@@ -1133,9 +2396,13 @@ def _persistent_game_loop_runner():
         init_db_tables()
         gm.loop_is_actually_running_flag = True
         gm.spawn_initial_npcs_and_entities()
-        app.logger.info(f"PID {pid}: Initial setup complete. Beginning persistent game loop.")
-    while gm.loop_is_actually_running_flag:
-        start_time = time.time()
+        write_behind_queue.start()
+        profiling = TICK_PROFILER and tick_profiler.install()
+        app.logger.info(f"PID {pid}: Initial setup complete, ready {time.monotonic() - worker_forked_at:.2f}s after fork ({len(gm.all_trees)} trees, {len(gm.scenes)} scenes). Beginning persistent game loop.{' Tick profiler on.' if profiling else ''}")
+    def run_one_tick():
+        start_time = time.monotonic()
+        if profiling:
+            tick_profiler.begin_tick()
         try:
             with app.app_context():
                 _game_loop_iteration_content()
@@ -1143,18 +2410,27 @@ def _persistent_game_loop_runner():
             with app.app_context():
                 app.logger.critical(f"PID {os.getpid()} H {gm.loop_iteration_count}: UNCAUGHT EXCEPTION IN ITERATION: {e}", exc_info = True)
             eventlet.sleep(1.0)
-        elapsed = time.time() - start_time
-        sleep_for = GAME_HEARTBEAT_RATE - elapsed
-        if sleep_for < 0:
+        if profiling:
+            tick_profiler.end_tick()
+        elapsed = time.monotonic() - start_time
+        tick_stats.record_tick(elapsed)
+        if elapsed > GAME_HEARTBEAT_RATE:
             with app.app_context():
-                app.logger.warning(f"PID {os.getpid()} H {gm.loop_iteration_count}: Iteration too long ({elapsed:.4f}s). No sleep.")
-            sleep_for = 0.0001
-        eventlet.sleep(sleep_for)
+                slow = ", ".join(f"{name} {v * 1000:.1f}ms" for name, v in tick_stats.last_overrun_phases.items())
+                app.logger.warning(f"PID {os.getpid()} H {gm.loop_iteration_count}: Iteration too long ({elapsed:.4f}s), overrun policy '{game_scheduler.overrun_policy}'. Phases: {slow}")
+                if profiling:
+                    app.logger.warning(f"PID {os.getpid()} H {gm.loop_iteration_count}: Hottest functions:\n{tick_profiler.report()}")
+    game_scheduler.run(run_one_tick, lambda: gm.loop_is_actually_running_flag)
+    if profiling:
+        tick_profiler.uninstall()
+    write_behind_queue.stop()
     with app.app_context():
         app.logger.info(f"PID {os.getpid()}: Persistent game loop runner terminating.")
 
-def start_game_loop_for_worker():
-    global _game_loop_started_in_this_process
+def start_game_loop_for_worker(forked_at = None):
+    global _game_loop_started_in_this_process, worker_forked_at
+    if forked_at is not None:
+        worker_forked_at = forked_at
     gm = get_game_manager() # Initialize/get gm for this worker before spawning
     with app.app_context():
         pid = os.getpid()
@@ -1172,64 +2448,111 @@ def start_game_loop_for_worker():
 game_blueprint = Blueprint('game', __name__, template_folder = 'templates', static_folder = 'static', static_url_path = '/static/game')
 @game_blueprint.route('/')
 def index_route():
-    return render_template('index.html')
+    # Without sticky sessions, long-polling requests could land on a worker that doesn't hold the socket.
+    return render_template('index.html', socket_transports = ['websocket'] if SCENE_SHARDS > 1 else ['polling', 'websocket'])
 app.register_blueprint(game_blueprint, url_prefix = GAME_PATH_PREFIX)
 sio.init_app(app, path = f"{GAME_PATH_PREFIX}/socket.io")
 @app.route('/')
 def health_check_route():
     return "OK", 200
+@app.route('/tick-stats')
+def tick_stats_route():
+    gm = get_game_manager()
+    return jsonify({
+        'pid': os.getpid(),
+        'shard': gm.shard_index,
+        'shard_count': gm.shard_count,
+        'loop_iteration': gm.loop_iteration_count,
+        'players': len(gm.players),
+        'remote_players': len(gm.remote_owner),
+        'scenes': gm.get_scene_stats(),
+        'tick': tick_stats.get_stats(),
+        'schedule': game_scheduler.get_stats(),
+        'fov_cache': gm.get_fov_cache_stats(),
+        'outbound': gm.socketio.get_stats(),
+        'actions': dict(gm.get_action_stats(), fast_applied = gm.fast_actions),
+        'write_behind': write_behind_queue.get_stats(),
+        'db_pool': db_pool.get_stats() if db_pool else None
+    })
 
 @sio.on('connect')
 def handle_connect_event(auth=None):
     gm = get_game_manager()
     with app.app_context():
-        player = gm.add_player(request.sid)
+        gm.local_sids.add(request.sid)
+        p_db_data = gm.load_player_data(request.sid)
+        if gm.shard_count > 1:
+            sx, sy = (p_db_data['scene_x'], p_db_data['scene_y']) if p_db_data else (0, 0)
+            owner = scene_shard(sx, sy, gm.shard_count)
+            if owner != gm.shard_index:
+                gm.remote_owner[request.sid] = owner
+                gm.shard_bus.publish(owner, {'type': 'join', 'sid': request.sid, 'state': p_db_data})
+                app.logger.info(f"Connect: {get_player_name(request.sid)}({request.sid}) routed to shard {owner} for scene ({sx}, {sy}).")
+                return
+        player = gm.add_player(request.sid, p_db_data)
         app.logger.info(f"Connect: {player.name}({request.sid}). Players: {len(gm.players)}")
-        cs = gm.get_or_create_scene(player.scene_x, player.scene_y)
-        avtl = [{'x': t[0], 'y': t[1]} for t in player.visible_tiles_cache]
-        initial_game_data = {
-            'player_data': player.get_full_data(),
-            'other_players_in_scene': gm.get_visible_players_for_observer(player),
-            'visible_npcs': gm.get_visible_npcs_for_observer(player),
-            'visible_trees': gm.get_visible_trees_for_observer(player),
-            'visible_terrain': cs.get_terrain_for_payload(player.visible_tiles_cache),
-            'all_visible_tiles': avtl,
-            'grid_width': GRID_WIDTH,
-            'grid_height': GRID_HEIGHT,
-            'tick_rate': GAME_HEARTBEAT_RATE,
-            'default_rain_intensity': DEFAULT_RAIN_INTENSITY,
-            'tree_char': TREE_CHAR,
-            'elf_char': ELF_CHAR
-        }
-        emit_ctx('initial_game_data',initial_game_data)
-        emit_ctx('lore_message', {'messageKey': "LORE.WELCOME_INITIAL", 'type': 'welcome-message'}, room = request.sid)
+        gm.send_initial_game_data(player)
 
 @sio.on('disconnect')
 def handle_disconnect_event(*args):
     gm = get_game_manager()
     with app.app_context():
+        gm.local_sids.discard(request.sid)
+        if request.sid not in gm.players and request.sid in gm.remote_owner:
+            gm.shard_bus.broadcast({'type': 'leave', 'sid': request.sid})
+            gm.remote_owner.pop(request.sid, None)
+            gm.action_queues.pop(request.sid, None)
+            app.logger.info(f"Disconnect for SID {request.sid}: owner shard notified.")
+            return
         player_left=gm.remove_player(request.sid)
         if player_left:
             app.logger.info(f"Disconnect: {player_left.name}({request.sid}) state saved. Players: {len(gm.players)}")
         else:
             app.logger.info(f"Disconnect for SID {request.sid} (player not found/removed).")
 
+@sio.on('client_options')
+def handle_client_options(data):
+    gm = get_game_manager()
+    if request.sid in gm.remote_owner:
+        gm.forward_to_owner({'type': 'client_options', 'sid': request.sid, 'options': data})
+        return
+    gm.apply_client_options(request.sid, data)
+
+@sio.on('request_full_sync')
+def handle_request_full_sync(*args):
+    gm = get_game_manager()
+    if request.sid in gm.remote_owner:
+        gm.forward_to_owner({'type': 'full_sync', 'sid': request.sid})
+        return
+    sync = gm.client_sync.get(request.sid)
+    if sync:
+        sync.last_view = None
+
 @sio.on('queue_player_action')
 def handle_queue_player_action(data):
     gm = get_game_manager()
+    queue = gm.action_queue(request.sid)
+    if not queue.allow():
+        return # Over ACTION_RATE: dropped without feedback, counted in queue.rate_limited
     with app.app_context():
         player = gm.get_player(request.sid)
-        if not player:
+        remote = not player and request.sid in gm.remote_owner
+        if not player and not remote:
             app.logger.warning(f"Action from unknown SID: {request.sid}")
             emit_ctx('action_feedback', {'success': False, 'message': "Player not recognized."})
             return
         action_type = data.get('type')
         valid_actions = ['move', 'look', 'drink_potion', 'say', 'shout', 'build_wall', 'destroy_wall', 'chop_tree']
         if action_type not in valid_actions:
-            app.logger.warning(f"Player {player.name} sent invalid action: {action_type}")
+            app.logger.warning(f"Player {player.name if player else request.sid} sent invalid action: {action_type}")
             emit_ctx('action_feedback', {'success': False, 'messageKey': 'ACTION_FAILED_UNKNOWN_COMMAND', 'placeholders': {'actionWord': action_type}})
             return
-        gm.queued_actions[request.sid] = data
+        if remote:
+            gm.forward_to_owner({'type': 'action', 'sid': request.sid, 'action': data})
+        elif FAST_ACTIONS and gm.try_fast_action(player, data):
+            return # Applied already; the game update it sent is the feedback
+        else:
+            queue.push(data)
         emit_ctx('action_feedback', {'success': True, 'messageKey': 'ACTION_QUEUED'})
 
 if __name__ == '__main__':
@@ -0,0 +1,388 @@
+# bench.py
+# In-process benchmarks for the game server. Run with: python bench.py <mode> [options]
+
+import argparse
+import gc
+import json
+import logging
+import math
+import random
+import sys
+import threading
+import time
+import tracemalloc
+
+import app as game
+
+def quiet_logs():
+    game.app.logger.setLevel(logging.WARNING)
+
+def fresh_game_manager():
+    game.game_manager_instance = None
+    return game.get_game_manager()
+
+def scatter_walls(scene, density, rng):
+    for y in range(game.GRID_HEIGHT):
+        for x in range(game.GRID_WIDTH):
+            if rng.random() < density:
+                scene.set_tile_type(x, y, game.TILE_WALL)
+
+def scatter_trees(gm, scene, count, rng):
+    for _ in range(count):
+        x, y = rng.randrange(game.GRID_WIDTH), rng.randrange(game.GRID_HEIGHT)
+        if not scene.is_walkable(x, y):
+            continue
+        tree = game.Tree(scene.scene_x, scene.scene_y, x, y)
+        gm.all_trees[tree.id] = tree
+        scene.add_tree(tree)
+
+def floor_origins(scene, count, rng):
+    origins = []
+    while len(origins) < count:
+        x, y = rng.randrange(game.GRID_WIDTH), rng.randrange(game.GRID_HEIGHT)
+        if scene.is_walkable(x, y):
+            origins.append((x, y))
+    return origins
+
+def bench_fov(args):
+    rng = random.Random(args.seed)
+    gm = fresh_game_manager()
+    gm.fov_cache_size = args.cache_size
+    scene = gm.get_or_create_scene(args.scene_x, args.scene_y)
+    scatter_walls(scene, args.wall_density, rng)
+    scatter_trees(gm, scene, args.trees, rng)
+    origins = floor_origins(scene, 64, rng)
+    print(f"FOV: {args.calls} calls per radius, wall density {args.wall_density}, {args.trees} trees")
+    for radius in args.radius:
+        start = time.perf_counter()
+        tiles = 0
+        for i in range(args.calls):
+            ox, oy = origins[i % len(origins)]
+            tiles += len(gm.calculate_fov(ox, oy, scene, radius))
+        elapsed = time.perf_counter() - start
+        print(f"  radius {radius:>2}: {elapsed / args.calls * 1e6:8.1f} us/call, {tiles / args.calls:6.1f} tiles/call")
+    if args.cache_size > 0:
+        print(f"  FOV cache: {gm.get_fov_cache_stats()}")
+
+def scatter_water(scene, density, rng):
+    for y in range(game.GRID_HEIGHT):
+        for x in range(game.GRID_WIDTH):
+            if scene.get_tile_type(x, y) == game.TILE_FLOOR and rng.random() < density:
+                scene.set_tile_type(x, y, game.TILE_WATER)
+
+def add_bench_player(gm, index, scene, x, y):
+    player = game.Player(f"bench-{index:05d}", f"Wizard-{index:05d}")
+    player.scene_x, player.scene_y, player.x, player.y = scene.scene_x, scene.scene_y, x, y
+    gm.players[player.id] = player
+    gm.client_sync[player.id] = game.ClientSyncState()
+    scene.add_player(player)
+    player.visible_tiles_cache = gm.calculate_fov(x, y, scene, game.SENSE_SIGHT_RANGE)
+    return player
+
+def bench_payload(args):
+    rng = random.Random(args.seed)
+    gm = fresh_game_manager()
+    scene = gm.get_or_create_scene(1, 1)
+    scatter_walls(scene, args.wall_density, rng)
+    scatter_water(scene, 0.1, rng)
+    for i, (x, y) in enumerate(floor_origins(scene, args.players, rng)):
+        add_bench_player(gm, i, scene, x, y)
+    views = [gm.build_client_view(p) for p in gm.players.values()]
+    print(f"Full game_update payloads: {args.players} players in one scene, {args.ticks} ticks")
+    for encoding in game.TILE_ENCODINGS:
+        start = time.perf_counter()
+        total_bytes = 0
+        for _ in range(args.ticks):
+            for view in views:
+                total_bytes += len(json.dumps(gm.full_payload_from_view(view, encoding)))
+        elapsed = time.perf_counter() - start
+        tile_bytes = args.ticks * sum(len(json.dumps(game.view_tiles_payload(view, encoding))) for view in views)
+        per_player = args.ticks * len(views)
+        print(f"  {encoding:>6}: {total_bytes / per_player:7.0f} B/player ({tile_bytes / per_player:6.0f} B of tiles), "
+              f"{elapsed / args.ticks * 1e3:7.2f} ms/tick build+serialize")
+
+class EmitCounter:
+    # Stands in for sio.emit: serializes each payload as the server would and counts the bytes instead of sending.
+    def __init__(self):
+        self.events = 0
+        self.bytes = 0
+        self.by_event = {}
+    def __call__(self, event, data = None, room = None, **kwargs):
+        size = len(json.dumps(data)) if data is not None else 0
+        self.events += 1
+        self.bytes += size
+        count, total = self.by_event.get(event, (0, 0))
+        self.by_event[event] = (count + 1, total + size)
+
+ACTION_MIX = (('move', 55), ('look', 10), ('say', 12), ('shout', 5), ('build_wall', 9), ('chop_tree', 9))
+DIRECTIONS = ((0, -1, '^'), (0, 1, 'v'), (-1, 0, '<'), (1, 0, '>'))
+CHATTER = ("hello", "anyone near the old oak?", "mana is low", "watch the water", "who built this wall")
+
+def random_action(rng):
+    action_type = rng.choices([a for a, _ in ACTION_MIX], weights = [w for _, w in ACTION_MIX])[0]
+    if action_type in ('say', 'shout'):
+        return {'type': action_type, 'details': {'message': rng.choice(CHATTER)}}
+    dx, dy, char = rng.choice(DIRECTIONS)
+    return {'type': action_type, 'details': {'dx': dx, 'dy': dy, 'newChar': char}}
+
+def scene_coords(count):
+    side = math.ceil(math.sqrt(count))
+    return [(i % side, i // side) for i in range(count)]
+
+def spawn_pixies(gm, scene, count, rng):
+    for x, y in floor_origins(scene, count, rng):
+        if scene.is_entity_at(x, y):
+            continue
+        pixie = game.ManaPixie(scene.scene_x, scene.scene_y, initial_x = x, initial_y = y)
+        gm.all_npcs[pixie.id] = pixie
+        scene.add_npc(pixie)
+
+def bench_tick(args):
+    rng = random.Random(args.seed)
+    random.seed(args.seed)
+    game.get_db_connection = lambda: None
+    counter = EmitCounter()
+    game.sio.emit = counter
+    gm = fresh_game_manager()
+    game.tick_stats = game.TickStats(window = args.ticks)
+    coords = scene_coords(args.scenes)
+    for sx, sy in coords:
+        scene = gm.get_or_create_scene(sx, sy)
+        scatter_walls(scene, args.wall_density, rng)
+        scatter_trees(gm, scene, args.trees, rng)
+        spawn_pixies(gm, scene, args.pixies, rng)
+    players = []
+    for i in range(args.players):
+        scene = gm.get_or_create_scene(*coords[i % len(coords)])
+        x, y = floor_origins(scene, 1, rng)[0]
+        player = add_bench_player(gm, i, scene, x, y)
+        sync = gm.client_sync[player.id]
+        sync.supports_deltas = args.deltas
+        sync.tile_encoding = args.tile_encoding
+        players.append(player)
+    game.write_behind_queue.flush()
+    print(f"Tick: {args.players} players in {args.scenes} scenes, {args.ticks} ticks (+{args.warmup} warmup), "
+          f"action rate {args.action_rate}, deltas {'on' if args.deltas else 'off'}, tiles {args.tile_encoding}")
+    if args.trace_allocations:
+        tracemalloc.start()
+    tick_times = []
+    peaks = []
+    for tick in range(args.warmup + args.ticks):
+        for player in players:
+            if rng.random() < args.action_rate:
+                gm.action_queue(player.id).push(random_action(rng))
+        if tick == args.warmup:
+            counter.__init__()
+            game.tick_stats = game.TickStats(window = args.ticks)
+        if args.trace_allocations:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        game._game_loop_iteration_content()
+        elapsed = time.perf_counter() - start
+        if args.trace_allocations and tick >= args.warmup:
+            peaks.append(tracemalloc.get_traced_memory()[1] - before)
+        if tick >= args.warmup:
+            tick_times.append(elapsed)
+            game.tick_stats.record_tick(elapsed)
+        game.write_behind_queue.flush()
+    if args.trace_allocations:
+        tracemalloc.stop()
+    pct = game.percentiles(tick_times)
+    print(f"  tick:   p50 {pct['p50'] * 1e3:7.2f} ms  p95 {pct['p95'] * 1e3:7.2f} ms  p99 {pct['p99'] * 1e3:7.2f} ms  "
+          f"max {max(tick_times) * 1e3:7.2f} ms  (budget {game.GAME_HEARTBEAT_RATE * 1e3:.0f} ms)")
+    for name, summary in game.tick_stats.get_stats()['phases'].items():
+        print(f"  {name:>15}: p50 {summary['p50']:7.2f} ms  p95 {summary['p95']:7.2f} ms  p99 {summary['p99']:7.2f} ms")
+    print(f"  emitted: {counter.events / args.ticks:8.1f} events/tick, {counter.bytes / args.ticks / 1024:8.1f} KiB/tick, "
+          f"{counter.bytes / args.ticks / max(1, args.players):7.0f} B/player/tick")
+    for event, (count, total) in sorted(counter.by_event.items(), key = lambda item: -item[1][1]):
+        print(f"    {event:>26}: {count / args.ticks:8.1f}/tick {total / args.ticks / 1024:8.1f} KiB/tick")
+    if peaks:
+        peak = game.percentiles(peaks)
+        print(f"  allocations: peak traced p50 {peak['p50'] / 1024:8.1f} KiB  p95 {peak['p95'] / 1024:8.1f} KiB per tick")
+    print(f"  FOV cache: {gm.get_fov_cache_stats()}")
+    print(f"  outbound: {gm.socketio.get_stats()}")
+    print(f"  scenes: {gm.get_scene_stats()}")
+
+def bench_npc(args):
+    rng = random.Random(args.seed)
+    random.seed(args.seed)
+    game.get_db_connection = lambda: None
+    gm = fresh_game_manager()
+    scenes = [gm.get_or_create_scene(sx, sy) for sx, sy in scene_coords(args.scenes)]
+    per_scene = args.npcs // args.scenes
+    for scene in scenes:
+        scatter_walls(scene, args.wall_density, rng)
+        scatter_trees(gm, scene, args.trees, rng)
+        homes = [gm.all_trees[tid] for tid in scene.get_tree_ids()]
+        for x, y in floor_origins(scene, per_scene, rng):
+            if homes and rng.random() < args.elf_share:
+                npc = game.Elf(scene.scene_x, scene.scene_y, initial_x = x, initial_y = y, home_tree_id = rng.choice(homes).id)
+            else:
+                npc = game.ManaPixie(scene.scene_x, scene.scene_y, initial_x = x, initial_y = y)
+            gm.all_npcs[npc.id] = npc
+            scene.add_npc(npc)
+    npcs = list(gm.all_npcs.values())
+    print(f"NPC AI: {len(npcs)} NPCs in {len(scenes)} scenes, {args.steps} steps")
+    samples = []
+    moves = 0
+    for _ in range(args.steps):
+        before = [(npc.x, npc.y) for npc in npcs]
+        start = time.perf_counter()
+        for scene in scenes:
+            gm.step_scene_npcs(scene)
+        samples.append(time.perf_counter() - start)
+        moves += sum(1 for npc, pos in zip(npcs, before) if (npc.x, npc.y) != pos)
+    total = sum(samples)
+    summary = game.percentiles([sample * 1000 for sample in samples])
+    print(f"  per step of all NPCs: p50 {summary['p50']:7.2f} ms  p95 {summary['p95']:7.2f} ms")
+    print(f"  {total / (len(npcs) * args.steps) * 1e6:6.2f} us/NPC step, {total / (len(npcs) * args.steps) * 1e5 * 1000:8.1f} ms per 100k NPC steps")
+    print(f"  moved {moves / (len(npcs) * args.steps):.3f} of NPC steps")
+
+def traced_bytes(build):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    objects = build()
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return used, objects
+
+def bench_memory(args):
+    rng = random.Random(args.seed)
+    def spot():
+        return rng.randrange(game.GRID_WIDTH), rng.randrange(game.GRID_HEIGHT)
+    kinds = (
+        ('ManaPixie', args.npcs // 2, lambda i: game.ManaPixie(i % 10, i // 10 % 10, *spot())),
+        ('Elf', args.npcs - args.npcs // 2, lambda i: game.Elf(i % 10, i // 10 % 10, *spot())),
+        ('Tree', args.trees, lambda i: game.Tree(i % 10, i // 10 % 10, *spot())),
+        ('Player', args.players, lambda i: game.Player(f"bench-{i:05d}", f"Wizard-{i:05d}")))
+    print(f"Entity memory: {args.npcs} NPCs, {args.trees} trees, {args.players} players (tracemalloc, includes ids and names)")
+    total = 0
+    kept = []
+    for name, count, make in kinds:
+        if count <= 0:
+            continue
+        used, objects = traced_bytes(lambda: [make(i) for i in range(count)])
+        kept.append(objects)
+        total += used
+        print(f"  {name:>10}: {used / count:7.0f} B/object {used / 1024:10.1f} KiB total")
+    print(f"  {'all':>10}: {total / 1024:10.1f} KiB")
+
+def bench_e2e(args):
+    try:
+        import socketio
+    except ImportError:
+        sys.exit("e2e mode needs the python-socketio client extras: pip install 'python-socketio[client]'")
+    rng = random.Random(args.seed)
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    def run_client(index):
+        client = socketio.Client(reconnection = False)
+        received = threading.Event()
+        state = {'ready': threading.Event()}
+        def on_update(data):
+            received.set()
+        client.on('game_update', on_update)
+        client.on('game_delta', on_update)
+        client.on('tick_bundle', lambda data: any(event in ('game_update', 'game_delta') for event, _ in data['events']) and received.set())
+        client.on('initial_game_data', lambda data: state['ready'].set())
+        try:
+            client.connect(args.url, socketio_path = f"{game.GAME_PATH_PREFIX}/socket.io", transports = ['websocket'])
+            state['ready'].wait(10)
+            if args.deltas:
+                client.emit('client_options', {'delta_updates': True, 'tile_encoding': 'bitset'})
+            local_rng = random.Random(args.seed * 1000 + index)
+            for _ in range(args.actions):
+                time.sleep(local_rng.uniform(0, args.think_time))
+                received.clear()
+                sent = time.perf_counter()
+                client.emit('queue_player_action', random_action(local_rng))
+                if received.wait(args.timeout):
+                    with lock:
+                        latencies.append(time.perf_counter() - sent)
+                else:
+                    with lock:
+                        errors.append('timeout')
+        except Exception as e:
+            with lock:
+                errors.append(repr(e))
+        finally:
+            client.disconnect()
+    print(f"E2E: {args.clients} clients against {args.url}, {args.actions} actions each")
+    threads = []
+    for i in range(args.clients):
+        thread = threading.Thread(target = run_client, args = (i,), daemon = True)
+        thread.start()
+        threads.append(thread)
+        time.sleep(rng.uniform(0, args.ramp / max(1, args.clients)))
+    for thread in threads:
+        thread.join()
+    if latencies:
+        pct = game.percentiles(latencies)
+        print(f"  action -> update: p50 {pct['p50'] * 1e3:7.1f} ms  p95 {pct['p95'] * 1e3:7.1f} ms  p99 {pct['p99'] * 1e3:7.1f} ms  "
+              f"max {max(latencies) * 1e3:7.1f} ms  ({len(latencies)} samples, heartbeat {game.GAME_HEARTBEAT_RATE * 1e3:.0f} ms)")
+    if errors:
+        print(f"  {len(errors)} failures, e.g. {errors[0]}")
+
+def main():
+    parser = argparse.ArgumentParser(description = "World of the Wand benchmarks")
+    parser.add_argument('--seed', type = int, default = 1)
+    sub = parser.add_subparsers(dest = 'mode', required = True)
+    fov = sub.add_parser('fov', help = "cost of GameManager.calculate_fov per call")
+    fov.add_argument('--radius', type = int, nargs = '+', default = [game.SENSE_SIGHT_RANGE, 12, 16, 27])
+    fov.add_argument('--calls', type = int, default = 2000)
+    fov.add_argument('--wall-density', type = float, default = 0.15)
+    fov.add_argument('--trees', type = int, default = 20)
+    fov.add_argument('--cache-size', type = int, default = 0, help = "FOV cache capacity (0 measures the raw shadowcaster)")
+    fov.add_argument('--scene-x', type = int, default = 1)
+    fov.add_argument('--scene-y', type = int, default = 1)
+    fov.set_defaults(run = bench_fov)
+    payload = sub.add_parser('payload', help = "bytes and serialization time of game_update payloads per tile encoding")
+    payload.add_argument('--players', type = int, default = 50)
+    payload.add_argument('--ticks', type = int, default = 20)
+    payload.add_argument('--wall-density', type = float, default = 0.15)
+    payload.set_defaults(run = bench_payload)
+    tick = sub.add_parser('tick', help = "in-process game loop ticks with simulated players, stubbed emit and no database")
+    tick.add_argument('--players', type = int, default = 200)
+    tick.add_argument('--scenes', type = int, default = 9)
+    tick.add_argument('--ticks', type = int, default = 100)
+    tick.add_argument('--warmup', type = int, default = 10)
+    tick.add_argument('--action-rate', type = float, default = 0.8, help = "chance each player queues an action per tick")
+    tick.add_argument('--wall-density', type = float, default = 0.1)
+    tick.add_argument('--trees', type = int, default = 6, help = "trees per scene")
+    tick.add_argument('--pixies', type = int, default = 2, help = "mana pixies per scene")
+    tick.add_argument('--deltas', action = 'store_true', help = "clients negotiate game_delta updates")
+    tick.add_argument('--tile-encoding', choices = game.TILE_ENCODINGS, default = 'list')
+    tick.add_argument('--trace-allocations', action = 'store_true', help = "measure peak allocated bytes per tick with tracemalloc (slows ticks)")
+    tick.set_defaults(run = bench_tick)
+    npc = sub.add_parser('npc', help = "cost of the batched NPC AI step")
+    npc.add_argument('--npcs', type = int, default = 10000)
+    npc.add_argument('--scenes', type = int, default = 200)
+    npc.add_argument('--steps', type = int, default = 10)
+    npc.add_argument('--trees', type = int, default = 4, help = "trees per scene, homes for the elves")
+    npc.add_argument('--elf-share', type = float, default = 0.5)
+    npc.add_argument('--wall-density', type = float, default = 0.1)
+    npc.set_defaults(run = bench_npc)
+    memory = sub.add_parser('memory', help = "resident bytes per NPC, tree and player object")
+    memory.add_argument('--npcs', type = int, default = 10000, help = "split evenly between pixies and elves")
+    memory.add_argument('--trees', type = int, default = 10000)
+    memory.add_argument('--players', type = int, default = 1000)
+    memory.set_defaults(run = bench_memory)
+    e2e = sub.add_parser('e2e', help = "latency from queue_player_action to the next game update, over real socket.io clients")
+    e2e.add_argument('--url', default = 'http://127.0.0.1:5000')
+    e2e.add_argument('--clients', type = int, default = 20)
+    e2e.add_argument('--actions', type = int, default = 20, help = "actions per client")
+    e2e.add_argument('--think-time', type = float, default = 0.5, help = "max random pause between a client's actions, seconds")
+    e2e.add_argument('--ramp', type = float, default = 2.0, help = "seconds over which clients connect")
+    e2e.add_argument('--timeout', type = float, default = 5.0)
+    e2e.add_argument('--deltas', action = 'store_true')
+    e2e.set_defaults(run = bench_e2e)
+    args = parser.parse_args()
+    quiet_logs()
+    args.run(args)
+
+if __name__ == '__main__':
+    main()
@@ -1,26 +1,51 @@
 # gunicorn_config.py
 import os
+import time
 import traceback
 
 # --- Gunicorn Settings ---
 bind = "0.0.0.0:" + os.environ.get("PORT", "10000")
 worker_class = 'eventlet'
-workers = 1
+# One worker per scene shard. More than one also needs SOCKETIO_MESSAGE_QUEUE (and a redis:// SHARD_BUS_URL, defaulting
+# to it); without them every worker would run its own full copy of the world, so refuse to start.
+workers = int(os.environ.get("SCENE_SHARDS", "1"))
+if workers > 1 and not os.environ.get("SOCKETIO_MESSAGE_QUEUE"):
+    raise RuntimeError(f"SCENE_SHARDS={workers} needs SOCKETIO_MESSAGE_QUEUE so emits reach clients on other workers.")
 # loglevel = 'info' # Set to 'debug' for more verbose Gunicorn logs if needed
 # accesslog = '-'   # Log access to stdout
 # errorlog = '-'    # Log Gunicorn errors to stdout
 
 # --- Server Hooks ---
+def pre_fork(server, worker):
+    # Runs in the master: hand each new worker the lowest shard index no live worker holds,
+    # so a replacement for a dead worker takes over exactly the scenes it owned.
+    taken = {getattr(w, "shard_index", None) for w in server.WORKERS.values()}
+    worker.shard_index = next(i for i in range(len(taken) + 1) if i not in taken)
+
 def post_fork(server, worker):
+    forked_at = time.monotonic() # Reported by the worker once it is ready to serve
     worker_pid = os.getpid()
-    server.log.info(f"Worker PID {worker_pid}: post_fork hook executing.")
+    server.log.info(f"Worker PID {worker_pid}: post_fork hook executing (shard {worker.shard_index} of {server.num_workers}).")
     
     try:
-        from app import start_game_loop_for_worker # Specific function to call
-        server.log.info(f"Worker PID {worker_pid}: Attempting to start game loop via app.start_game_loop_for_worker.")
-        start_game_loop_for_worker() # Call the designated function
+        from app import configure_scene_shard, start_game_loop_for_worker # Specific functions to call
     except ImportError:
-        server.log.error(f"Worker PID {worker_pid}: CRITICAL - Could not import 'start_game_loop_for_worker' from 'app'. Ensure app.py and this function exist.")
+        server.log.error(f"Worker PID {worker_pid}: CRITICAL - Could not import 'configure_scene_shard'/'start_game_loop_for_worker' from 'app'. Ensure app.py and this function exist.")
+        return
+    configure_scene_shard(worker.shard_index, server.num_workers) # Raises on a shard setup that can't work; the worker must not boot
+    try:
+        server.log.info(f"Worker PID {worker_pid}: Attempting to start game loop via app.start_game_loop_for_worker.")
+        start_game_loop_for_worker(forked_at) # Call the designated function
     except Exception as e:
         server.log.error(f"Worker PID {worker_pid}: CRITICAL - Error in post_fork when trying to start game loop: {e}")
-        server.log.error(traceback.format_exc())
\ No newline at end of file
+        server.log.error(traceback.format_exc())
+
+def worker_exit(server, worker):
+    # Write out anything still waiting in the write-behind queue before the worker goes away.
+    try:
+        from app import write_behind_queue
+        write_behind_queue.stop()
+        server.log.info(f"Worker PID {os.getpid()}: write-behind queue flushed on exit.")
+    except Exception as e:
+        server.log.error(f"Worker PID {os.getpid()}: Error flushing write-behind queue on exit: {e}")
+        server.log.error(traceback.format_exc())